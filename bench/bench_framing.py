@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Benchmark for line framing and outgoing writes
+
+Compares the old asynchat way of doing things (search for one
+terminator at a time, `bytes +=` into the line buffer, one send per
+line) with irc_framing.LineBuffer and batched sends.
+
+usage: ./bench/bench_framing.py [--lines N] [--recv-size BYTES]
+'''
+
+import argparse
+import socket
+import sys
+import threading
+from os.path import abspath, dirname
+from time import perf_counter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from irc_framing import LineBuffer, encode_lines  # NOQA pylint: disable=wrong-import-position
+
+
+SAMPLE = (':nick{0}!user@host.example.com PRIVMSG #channel :this is message '
+          'number {0} with a little bit of padding to look like chat\r\n')
+
+
+class AsynchatFraming:
+    ''' What asynchat.async_chat.handle_read plus the old
+    IRCClient.collect_incoming_data did with each recv
+    '''
+    def __init__(self):
+        self.ac_in_buffer = b''
+        self.ibuffer = bytes()
+        self.lines = []
+
+    def feed(self, data):  # pylint: disable=missing-docstring
+        self.ac_in_buffer = self.ac_in_buffer + data
+        terminator = b'\r\n'
+        while self.ac_in_buffer:
+            index = self.ac_in_buffer.find(terminator)
+            if index != -1:
+                if index > 0:
+                    self.ibuffer += self.ac_in_buffer[:index]
+                self.ac_in_buffer = self.ac_in_buffer[index + len(terminator):]
+                self.lines.append(self.ibuffer)
+                self.ibuffer = bytes()
+            else:
+                self.ibuffer += self.ac_in_buffer
+                self.ac_in_buffer = b''
+
+
+def make_chunks(num_lines, recv_size):
+    ''' Build the stream of recv() results for a burst of lines '''
+    stream = ''.join(SAMPLE.format(i) for i in range(num_lines)).encode()
+    return [stream[i:i + recv_size] for i in range(0, len(stream), recv_size)]
+
+
+def bench_inbound(chunks, num_lines):
+    ''' Lines per second for both ways of framing '''
+    old = AsynchatFraming()
+    start = perf_counter()
+    for chunk in chunks:
+        old.feed(chunk)
+    old_time = perf_counter() - start
+    assert len(old.lines) == num_lines
+
+    new = LineBuffer()
+    count = 0
+    start = perf_counter()
+    for chunk in chunks:
+        count += len(new.feed(chunk))
+    new_time = perf_counter() - start
+    assert count == num_lines
+
+    return num_lines / old_time, num_lines / new_time
+
+
+def _drain(sock):
+    while sock.recv(1 << 16):
+        pass
+
+
+def _timed_send(send, num_lines):
+    writer, reader = socket.socketpair()
+    drainer = threading.Thread(target=_drain, args=(reader,))
+    drainer.start()
+    try:
+        start = perf_counter()
+        send(writer)
+        elapsed = perf_counter() - start
+    finally:
+        writer.close()
+        drainer.join()
+        reader.close()
+    return num_lines / elapsed
+
+
+def bench_outbound(num_lines, batch):
+    ''' Lines per second written with one send() per line versus
+    one sendmsg() per batch of lines
+    '''
+    texts = [SAMPLE.format(i)[:-2] for i in range(num_lines)]
+
+    def send_each(sock):
+        for text in texts:
+            sock.sendall(bytes('{}\r\n'.format(text), 'UTF-8'))
+
+    def send_batched(sock):
+        for i in range(0, num_lines, batch):
+            buffers = encode_lines(texts[i:i + batch])
+            sent = sock.sendmsg(buffers)
+            total = sum(len(b) for b in buffers)
+            if sent < total:
+                sock.sendall(b''.join(buffers)[sent:])
+
+    return _timed_send(send_each, num_lines), _timed_send(send_batched, num_lines)
+
+
+def main():  # pylint: disable=missing-docstring
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--recv-size', type=int, default=65536)
+    parser.add_argument('--batch', type=int, default=32)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.lines, args.recv_size)
+    old_in, new_in = bench_inbound(chunks, args.lines)
+    old_out, new_out = bench_outbound(args.lines, args.batch)
+
+    print('{:<10} {:>16} {:>16} {:>8}'.format('', 'before (l/s)', 'after (l/s)', 'speedup'))
+    print('{:<10} {:>16,.0f} {:>16,.0f} {:>7.1f}x'.format('inbound', old_in, new_in,
+                                                          new_in / old_in))
+    print('{:<10} {:>16,.0f} {:>16,.0f} {:>7.1f}x'.format('outbound', old_out, new_out,
+                                                          new_out / old_out))
+
+
+if __name__ == '__main__':
+    main()
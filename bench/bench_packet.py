@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Benchmark for ircpacket.Packet
+
+Compares the single-pass parser with the original one (bench/legacy_packet.py)
+on each kind of line in bench/microbench.py, plus a realistic mix of
+traffic (where the same people talk over and over) and the same mix
+where every line comes from someone new. Before timing anything, both parsers are checked to agree on
+every field the old one filled in.
+
+usage: ./bench/bench_packet.py [--repeat N] [--number N]
+'''
+
+import argparse
+import sys
+import timeit
+from functools import partial
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from ircpacket import PREFIX_CACHE, Packet  # NOQA pylint: disable=wrong-import-position
+from legacy_packet import LegacyPacket  # NOQA pylint: disable=wrong-import-position
+from microbench import PACKETS  # NOQA pylint: disable=wrong-import-position
+
+
+# Roughly what a busy channel looks like
+MIX = (['privmsg'] * 70 + ['action'] * 5 + ['numeric'] * 5 + ['ping'] * 2 +
+       ['nick'] * 3 + ['join'] * 10 + ['tagged'] * 5)
+
+FIELDS = ('sender', 'host', 'target', 'msg_type', 'numeric', 'text', 'is_action',
+          'nick_to')
+
+
+def check_fields():
+    ''' Make sure the new parser gives the same answers as the old one.
+    Fields the old parser left empty (like the text of numerics) don't count,
+    and neither do tagged lines, which the old parser didn't understand.
+    '''
+    for kind, line in PACKETS.items():
+        if line.startswith('@'):
+            continue
+        old, new = LegacyPacket(line), Packet(line)
+        for field in FIELDS:
+            if getattr(old, field) not in (None, getattr(new, field)):
+                raise AssertionError('{}: {} is {!r}, was {!r}'.format(
+                    kind, field, getattr(new, field), getattr(old, field)))
+
+
+def best_times(lines, repeat: int, number: int, fresh: bool = False) -> tuple:
+    ''' Best time for each parser to parse every line in `lines`, per line.
+    The parsers take turns, so that noise hits both of them alike.
+    If `fresh` is set, remembered prefixes are forgotten every time.
+    '''
+    def parse_all(cls):  # pylint: disable=missing-docstring
+        if fresh:
+            PREFIX_CACHE.clear()
+        for line in lines:
+            cls(line)
+    timers = [timeit.Timer(partial(parse_all, cls)) for cls in (LegacyPacket, Packet)]
+    best = [float('inf'), float('inf')]
+    for _ in range(repeat):
+        for num, timer in enumerate(timers):
+            best[num] = min(best[num], timer.timeit(number))
+    return tuple(total / number / len(lines) for total in best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--repeat', type=int, default=9, help='number of timed runs')
+    parser.add_argument('--number', type=int, default=1000, help='loops per timed run')
+    args = parser.parse_args()
+
+    check_fields()
+
+    cases = [(kind, [line]) for kind, line in PACKETS.items()]
+    cases.append(('mix', [PACKETS[kind] for kind in MIX]))
+    # Every line from somebody new, so parsed prefixes can't be reused
+    cases.append(('mix_unique', [PACKETS[kind].replace('nick!', 'nick{}!'.format(num))
+                                 for num, kind in enumerate(MIX)]))
+
+    print('{:10} {:>10} {:>10} {:>8}'.format('line', 'old', 'new', 'speedup'))
+    for kind, lines in cases:
+        number = args.number if len(lines) > 1 else args.number * 50
+        old, new = best_times(lines, args.repeat, number, fresh=kind == 'mix_unique')
+        print('{:10} {:>7.0f} ns {:>7.0f} ns {:>7.2f}x'.format(kind, old * 1e9, new * 1e9,
+                                                                 old / new))
+
+
+if __name__ == '__main__':
+    main()
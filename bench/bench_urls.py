@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''
+Benchmark for irc_urls.UrlExtractor
+
+Compares the extractor with the link regex linkinfo used to use
+(bench/legacy_urlregex.py), on lines with links and lines without.
+Before timing anything, both are checked to find the same first link
+in every line, apart from the lines in DIFFERENT, where the old regex
+was wrong. Finding every link is timed the way linkinfo does it: search()
+for the first, then find_urls_from() for the rest.
+
+usage: ./bench/bench_urls.py [--repeat N] [--number N]
+'''
+
+import argparse
+import re
+import sys
+import timeit
+from collections import OrderedDict
+from functools import partial
+from os.path import abspath, dirname, join
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from irc_urls import UrlExtractor, load_tlds  # NOQA pylint: disable=wrong-import-position
+from legacy_urlregex import URLREGEX  # NOQA pylint: disable=wrong-import-position
+
+
+LINES = OrderedDict((
+    ('url_only', 'https://example.com/articles/2016/some-long-title?ref=irc'),
+    ('url', 'check this out https://example.com/articles/2016/some-long-title?ref=irc'),
+    ('url_late', 'has anybody read the article about the new release yet? '
+                 'it is at https://example.com/articles/2016/some-long-title'),
+    ('bare_url', 'it is on example.com/downloads if you want it'),
+    ('wiki_url', 'see (https://en.wikipedia.org/wiki/Python_(programming_language)).'),
+    ('two_urls', 'compare http://one.example.org/a and www.two.example.net/b please'),
+    ('chatter', 'just chatting with everybody, nothing to see here'),
+    ('punctuated', 'well... I guess so. it was fine, i.e. not great. v1.2 is out'),
+    ('long_chatter', ' '.join(['lorem ipsum dolor sit amet'] * 20)),
+    ('dots', 'a.' * 200 + '!'),
+))
+
+# Lines the two are known to disagree on: line -> what the extractor finds
+DIFFERENT = {
+    # The old regex took anything after "http:" as a link
+    'http:nothing here': None,
+    # ...and stopped a bare host at a port
+    'try example.com:8080/app': 'example.com:8080/app',
+    # ...and found links in the middle of words and email addresses
+    'xhttp://example.com': None,
+    'me@example.com/path': None,
+}
+
+# Lines both should agree on
+AGREE = (
+    'http://example.com', 'https://example.com/', 'HTTP://EXAMPLE.COM/PATH',
+    'visit example.com.', 'visit example.com, then example.org',
+    '(example.com)', '"https://example.com/a?b=c&d=e"', 'example.com/foo,',
+    'mail me@example.com', 'e.g. this', 'version 3.14',
+    'file.py is broken', 'node.js', 'www.example.co.uk/page#frag',
+    'http://localhost:8000/test', 'http://127.0.0.1/', 'https://example.com/a_(b)_c',
+    '<https://example.com/x>', 'https://example.com/wiki/[thing]',
+    'https://example.com/end?', 'a.b', 'foo.com\'s website',
+    '...', 'http://', 'https://.', '-example.com', 'example.com-',
+) + tuple(LINES.values())
+
+
+def first_old(regex, line: str):
+    ''' The link the old regex found, if any '''
+    match = regex.search(line)
+    return None if match is None else match.group(0)
+
+
+def first_new(extractor: UrlExtractor, line: str):
+    ''' The first link the extractor found, if any '''
+    match = extractor.search(line)
+    return None if match is None else match.group(0)
+
+
+def every_new(extractor: UrlExtractor, line: str) -> list:
+    ''' Every link in the line, the way linkinfo gets them: search() for
+    the first, then carry on from there
+    '''
+    match = extractor.search(line)
+    return [] if match is None else extractor.find_urls_from(match)
+
+
+def check_agreement(regex, extractor: UrlExtractor):
+    ''' Make sure the extractor finds the same links as the old regex '''
+    for line in AGREE:
+        old, new = first_old(regex, line), first_new(extractor, line)
+        if old != new:
+            raise AssertionError('{!r}: found {!r}, the regex found {!r}'.format(line, new, old))
+    for line, wanted in DIFFERENT.items():
+        new = first_new(extractor, line)
+        if new != wanted:
+            raise AssertionError('{!r}: found {!r}, wanted {!r}'.format(line, new, wanted))
+
+
+def best_times(funcs, line: str, repeat: int, number: int) -> list:
+    ''' Best time for each of `funcs` to search `line`.
+    They take turns, so that noise hits all of them alike.
+    '''
+    timers = [timeit.Timer(lambda func=func: func(line)) for func in funcs]
+    best = [float('inf')] * len(timers)
+    for _ in range(repeat):
+        for num, timer in enumerate(timers):
+            best[num] = min(best[num], timer.timeit(number))
+    return [total / number for total in best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs')
+    parser.add_argument('--number', type=int, default=200, help='loops per timed run')
+    args = parser.parse_args()
+
+    regex = re.compile(URLREGEX)
+    extractor = UrlExtractor(load_tlds(join(ROOT, 'data/tlds.txt')))
+    check_agreement(regex, extractor)
+
+    for line in AGREE + tuple(DIFFERENT):
+        if every_new(extractor, line) != extractor.find_urls(line):
+            raise AssertionError('{!r}: find_urls_from() disagrees with find_urls()'.format(line))
+
+    # search() finds the first link, like the regex did; the rest is every link
+    funcs = (regex.search, extractor.search, regex.findall, partial(every_new, extractor))
+
+    print('{:14} {:>12} {:>12} {:>8} {:>12} {:>12} {:>8}'.format(
+        'line', 'regex', 'extractor', 'speedup', 'regex (all)', 'extr. (all)', 'speedup'))
+    for kind, line in LINES.items():
+        number = max(1, args.number // 100) if kind == 'dots' else args.number
+        first, new_first, every, new_every = best_times(funcs, line, args.repeat, number)
+        print('{:14} {:>9.2f} us {:>9.2f} us {:>7.1f}x {:>9.2f} us {:>9.2f} us {:>7.1f}x'.format(
+            kind, first * 1e6, new_first * 1e6, first / new_first,
+            every * 1e6, new_every * 1e6, every / new_every))
+
+
+if __name__ == '__main__':
+    main()
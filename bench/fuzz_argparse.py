@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Differential fuzzer for irc_argparse.parse
+
+Throws random strings at the tokenizer and at the old character by
+character parser (bench/legacy_argparse.py), and complains about any
+string they split differently. The strings are heavy on quotes,
+backslashes, and symbols, since that's where the two could disagree.
+
+usage: ./bench/fuzz_argparse.py [--count N] [--seed N]
+'''
+
+import argparse
+import random
+import sys
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from irc_argparse import parse, scan_command  # NOQA pylint: disable=wrong-import-position
+from legacy_argparse import legacy_parse  # NOQA pylint: disable=wrong-import-position
+from microbench import ARGS  # NOQA pylint: disable=wrong-import-position
+
+
+# Characters to build strings out of, grouped by how the parser treats them
+ALPHABET = ('"', "'", '\\', ' ', '\t', 'a', 'b', '1', '_', 'é', 'ж', '7',
+            ':', ',', '.', '!', '#', '^', '-', '[', ']', '{', '}', '|', '~', '`', '\x01', '…')
+
+
+def random_string(rand: random.Random) -> str:
+    ''' A short string, mostly made of interesting characters '''
+    length = rand.choice((1, 2, 3, 5, 8, 13, 40))
+    return ''.join(rand.choice(ALPHABET) for _ in range(length))
+
+
+def check(args: str) -> bool:
+    ''' Do both parsers agree on `args`? Asks twice to check the cache too.
+    The command name found by scan_command has to match as well.
+    '''
+    expected = legacy_parse(args)
+    if parse.__wrapped__(args) != expected or not parse(args) == expected == parse(args):
+        print('mismatch for {!r}:\n  old: {!r}\n  new: {!r}'.format(
+            args, expected, parse.__wrapped__(args)))
+        return False
+
+    command = scan_command(args)[0]
+    if command != (expected[0] if expected else None):
+        print('wrong command for {!r}: {!r}, words are {!r}'.format(args, command, expected))
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--count', type=int, default=200000, help='strings to try')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    rand = random.Random(seed)
+
+    texts = list(ARGS.values()) + [random_string(rand) for _ in range(args.count)]
+    failures = 0
+    for tried, text in enumerate(texts, 1):
+        failures += not check(text)
+        if failures >= 10:
+            break
+
+    print('seed {}: {} strings, {} mismatches'.format(seed, tried, failures))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
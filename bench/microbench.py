@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Microbenchmarks for the parsing and dispatch hot path
+
+Every benchmark is timed with timeit: the number of loops is picked so
+that one run takes about --min-time seconds, and that's repeated
+--repeat times. The median time per call is what gets compared.
+
+Results can be saved as JSON with --output, and compared with a saved
+run with --compare. When comparing, benchmarks which got slower by more
+than --threshold percent are flagged, and the exit status is 1.
+
+usage: ./bench/microbench.py [--filter TEXT] [--output FILE] [--compare FILE]
+'''
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import irc_argparse  # NOQA pylint: disable=wrong-import-position
+import ircpacket as ircp  # NOQA pylint: disable=wrong-import-position
+import probot  # NOQA pylint: disable=wrong-import-position
+
+
+BOT_NICK = 'probot'
+
+PACKETS = OrderedDict((
+    ('privmsg', ':nick!user@host.example.com PRIVMSG #channel :hello there, '
+                'how is everyone doing today?'),
+    ('action', ':nick!user@host.example.com PRIVMSG #channel :\001ACTION waves at everyone\001'),
+    ('numeric', ':irc.example.com 372 probot :- Welcome to the message of the day'),
+    ('ping', 'PING :irc.example.com'),
+    ('nick', ':nick!user@host.example.com NICK :newnick'),
+    ('join', ':nick!user@host.example.com JOIN :#channel'),
+    ('tagged', '@time=2016-06-01T12:00:00.000Z;account=nick :nick!user@host.example.com '
+               'PRIVMSG #channel :hello there'),
+))
+
+ARGS = OrderedDict((
+    ('short', 'calc 2 + 2'),
+    ('quoted', 'say #channel "hello there, everyone" \'and you\' too'),
+    ('escaped', r'say #channel hello\ there \"friend\" \\o/'),
+    ('long', 'word ' * 200),
+    ('quotes', '"' * 500),
+    ('mismatched', ' '.join('"unterminated \'quote' for _ in range(50))),
+    ('backslashes', '\\' * 1000),
+    ('symbols', '!@#$%^&*()_+-=[]{}|<>;/?' * 40),
+))
+
+# (name, text) of PRIVMSGs to send through handle_regexes
+REGEX_TEXTS = OrderedDict((
+    ('chatter', 'did anyone see the game last night? that was something else'),
+    ('long_chatter', 'so anyways, ' * 40 + 'that is why I think so'),
+    ('punctuated', 'yeah I saw it. it was fine, whatever'),
+    ('greeting', 'hey probot'),
+    ('substitution', 's/game/match/'),
+))
+
+URL_TEXT = 'check this out https://example.com/articles/2016/some-long-title?ref=irc'
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    ''' Register a function which sets up a benchmark and returns
+    the zero-argument callable to be timed.
+    '''
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def make_shared() -> dict:
+    ''' Set up the bot with every plugin that doesn't need an outside program '''
+    probot.DISABLED_PLUGINS.add('fortune')
+    config = {
+        'nick': BOT_NICK,
+        'password': '',
+        'channels': '#channel',
+        'prefix': ':',
+        'admin': 'benchadmin',
+        'adminpass': 'benchpass',
+        'intro': 'Benchmarking!',
+        'oxr_id': '',
+        'address': '127.0.0.1',
+        'port': '6667',
+        'workers': '0',
+    }
+    shared = probot.setup(config)
+    return next(iter(shared['networks'].values()))
+
+
+def packet_bench(line: str):
+    ''' Time parsing a line into a Packet '''
+    def setup_bench(_):  # pylint: disable=missing-docstring
+        return lambda: ircp.Packet(line)
+    return setup_bench
+
+
+def argparse_bench(args: str):
+    ''' Time splitting a command into words, skipping the cache '''
+    def setup_bench(_):  # pylint: disable=missing-docstring
+        return lambda: irc_argparse.parse.__wrapped__(args)
+    return setup_bench
+
+
+def register_parsing():
+    ''' Packet and argument parsing, one benchmark per kind of input '''
+    for kind, line in PACKETS.items():
+        benchmark('packet.{}'.format(kind))(packet_bench(line))
+    for kind, args in ARGS.items():
+        benchmark('argparse.{}'.format(kind))(argparse_bench(args))
+
+
+@benchmark('argparse.cached')
+def bench_argparse_cached(_):  # pylint: disable=missing-docstring
+    args = ARGS['quoted']
+    return lambda: irc_argparse.parse(args)
+
+
+def privmsg(text: str, sender: str = 'someone', target: str = '#channel') -> ircp.Packet:
+    ''' Make a PRIVMSG packet '''
+    return ircp.Packet(':{0}!{0}@host.example.com PRIVMSG {1} :{2}'.format(sender, target, text))
+
+
+def command_bench(text: str):
+    ''' Time handle_commands, without cooldowns getting in the way '''
+    def setup_bench(shared):  # pylint: disable=missing-docstring
+        packet = privmsg(text)
+        cooldowns = shared['cooldowns']
+
+        def run():  # pylint: disable=missing-docstring
+            cooldowns.clear()
+            return probot.handle_commands(packet, shared)
+        return run
+    return setup_bench
+
+
+def regex_bench(text: str):
+    ''' Time handle_regexes with every plugin regex loaded '''
+    def setup_bench(shared):  # pylint: disable=missing-docstring
+        packet = privmsg(text)
+        shared['recent_messages'].append(privmsg('the game was great'))
+        cooldowns = shared['cooldowns']
+
+        def run():  # pylint: disable=missing-docstring
+            cooldowns.clear()
+            return probot.handle_regexes(packet, shared)
+        return run
+    return setup_bench
+
+
+def search_bench(name: str, text: str):
+    ''' Time a single plugin regex on its own '''
+    def setup_bench(shared):  # pylint: disable=missing-docstring
+        regex = shared['regexes'][name]
+        return lambda: regex.search(text)
+    return setup_bench
+
+
+def register_dispatch(shared: dict):
+    ''' Command and regex dispatch, which need the plugins loaded '''
+    commands = OrderedDict((
+        ('command', ':test'),
+        ('command_args', ':calc 3 * (4 + 5) / 2'),
+        ('unknown', ':thisdoesnotexist'),
+        ('emoticon', ':D haha "that" was great'),
+        ('not_command', 'just chatting, nothing to see here'),
+    ))
+    for kind, text in commands.items():
+        benchmark('handle_commands.{}'.format(kind))(command_bench(text))
+
+    for kind, text in REGEX_TEXTS.items():
+        benchmark('handle_regexes.{}'.format(kind))(regex_bench(text))
+
+    for name in sorted(shared['regexes']):
+        benchmark('regex.{}.chatter'.format(name))(search_bench(name, REGEX_TEXTS['chatter']))
+        benchmark('regex.{}.url'.format(name))(search_bench(name, URL_TEXT))
+
+
+@benchmark('make_message')
+def bench_make_message(_):  # pylint: disable=missing-docstring
+    return lambda: ircp.make_message('hello there, how are you?', '#channel')
+
+
+@benchmark('packet.reply')
+def bench_reply(_):  # pylint: disable=missing-docstring
+    packet = privmsg('hello', target=BOT_NICK)
+    return lambda: packet.reply('hello there, how are you?')
+
+
+def time_benchmark(func, repeat: int, min_time: float) -> dict:
+    ''' Time a callable, timeit style. Times are seconds per call. '''
+    timer = timeit.Timer(func)
+
+    # Like Timer.autorange, but with a configurable minimum
+    loops = 1
+    while True:
+        if timer.timeit(loops) >= min_time:
+            break
+        loops *= 2 if loops < 10 else 10
+
+    times = [total / loops for total in timer.repeat(repeat, loops)]
+    return {
+        'loops': loops,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def format_time(seconds: float) -> str:
+    ''' Format a time in whatever unit makes sense '''
+    if seconds < 1e-6:
+        return '{:.0f} ns'.format(seconds * 1e9)
+    elif seconds < 1e-3:
+        return '{:.2f} us'.format(seconds * 1e6)
+    return '{:.2f} ms'.format(seconds * 1e3)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    ''' Print how each benchmark changed. Returns the names of the ones
+    that got slower by more than `threshold` percent.
+    '''
+    regressions = []
+    print()
+    print('{:42} {:>12} {:>12} {:>9}'.format('benchmark', 'baseline', 'now', 'change'))
+    for name, result in results.items():
+        if name not in baseline:
+            print('{:42} {:>12} {:>12} {:>9}'.format(name, '-', format_time(result['median']),
+                                                     'new'))
+            continue
+        old = baseline[name]['median']
+        change = (result['median'] - old) / old * 100
+        mark = ''
+        if change > threshold:
+            mark = '  SLOWER'
+            regressions.append(name)
+        elif change < -threshold:
+            mark = '  faster'
+        print('{:42} {:>12} {:>12} {:>+8.1f}%{}'.format(
+            name, format_time(old), format_time(result['median']), change, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--filter', default='', help='only run benchmarks with this in their name')
+    parser.add_argument('--list', action='store_true', help='list benchmarks and exit')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs')
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='minimum seconds per timed run')
+    parser.add_argument('--output', help='save results as JSON to this file')
+    parser.add_argument('--compare', help='compare with results saved by --output')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent slower which counts as a regression')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    os.chdir(ROOT)  # Plugins load their data relative to here
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        shared = make_shared()
+    register_parsing()
+    register_dispatch(shared)
+
+    selected = [name for name in BENCHMARKS if args.filter in name]
+    if args.list:
+        print('\n'.join(selected))
+        return
+
+    results = OrderedDict()
+    for name in selected:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            func = BENCHMARKS[name](shared)
+            result = time_benchmark(func, args.repeat, args.min_time)
+        results[name] = result
+        print('{:42} {:>12} +- {:>10}  (min {})'.format(
+            name, format_time(result['median']), format_time(result['stdev']),
+            format_time(result['min'])))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'results': results}, output, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n{} benchmark(s) got slower: {}'.format(len(regressions),
+                                                            ', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
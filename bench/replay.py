@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Load generator: replay IRC traffic into a real IRCClient
+
+A fake IRC server is started on localhost, the bot connects to it and
+registers like it would anywhere else, and then the server replays
+traffic at a fixed rate (or as fast as it can). Every reply the bot
+sends is matched up with the line that caused it, to get end-to-end
+latency. PING markers are mixed in every so often, to measure how
+long protocol traffic waits behind everything else.
+
+The synthetic traffic is a mix of commands (sent privately, from a
+different nick each time, so replies can be matched and cooldowns
+don't get in the way), chatter, URLs, and JOIN/PART/NICK churn.
+A captured traffic file (one raw line per line, as sent by a server)
+can be replayed with --traffic instead.
+
+Plugins which talk to the internet are disabled unless --online is
+given. Flood control is turned off, since it would otherwise be the
+only thing being measured.
+
+usage: ./bench/replay.py [--lines N] [--rate LINES/S] [--sweep] [--traffic FILE]
+'''
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+from collections import deque
+from contextlib import redirect_stdout
+from os.path import abspath, dirname
+from time import perf_counter
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ircpacket as ircp  # NOQA pylint: disable=wrong-import-position
+import probot  # NOQA pylint: disable=wrong-import-position
+
+
+BOT_NICK = 'probot'
+CHANNEL = '#bench'
+PREFIX = ':'
+
+# Plugins which need the internet (or external programs) to reply
+NETWORK_PLUGINS = ('convert', 'fortune', 'linkinfo', 'wikipedia')
+
+MARKER_EVERY = 100   # Lines between PING markers
+WRITE_BATCH = 256    # Lines written at once when there is no rate limit
+
+COMMANDS = ('test', 'info', 'help calc', 'calc 3 * (4 + 5) / 2', 'hello',
+            'commands', 'plugins', 'nope')
+CHATTER = ('hey, anyone around?',
+           'I think the build is broken again',
+           'lol',
+           'did you see that s/teh/the/ thing earlier',
+           'no idea, ask in the other channel',
+           'brb getting coffee',
+           'well that was a whole lot of text for something which really '
+           'could have been said in about five words, but here we are',
+           'probot: are you there?')
+URLS = ('check this out https://example.com/articles/2016/some-long-title',
+        'http://example.org/ is down again',
+        'https://www.example.net/watch?v=abc123&t=42 lmao')
+
+# Share of each kind of synthetic line (the rest is chatter)
+MIX = (('command', 0.20), ('url', 0.10), ('join', 0.05), ('part', 0.05), ('nick', 0.05))
+
+
+def synthetic_traffic(num_lines: int, seed: int) -> list:
+    ''' Generate a list of (line, reply_key) tuples. reply_key is what the
+    bot's reply will be addressed to, or None if no reply is expected.
+    '''
+    rand = random.Random(seed)
+    traffic = []
+    lurkers = ['lurker{}'.format(i) for i in range(50)]
+
+    for num in range(num_lines):
+        roll = rand.random()
+        kind = 'chatter'
+        for name, share in MIX:
+            if roll < share:
+                kind = name
+                break
+            roll -= share
+
+        nick = rand.choice(lurkers)
+        source = ':{0}!{0}@users.example.com'.format(nick)
+
+        if kind == 'command':
+            # A fresh nick for every command keeps cooldowns out of the way
+            sender = 'bench{}'.format(num)
+            line = ':{0}!{0}@users.example.com PRIVMSG {1} :{2}{3}'.format(
+                sender, BOT_NICK, PREFIX, rand.choice(COMMANDS))
+            traffic.append((line, sender.lower()))
+        elif kind == 'url':
+            traffic.append(('{} PRIVMSG {} :{}'.format(source, CHANNEL, rand.choice(URLS)), None))
+        elif kind == 'join':
+            traffic.append(('{} JOIN :{}'.format(source, CHANNEL), None))
+        elif kind == 'part':
+            traffic.append(('{} PART {} :later'.format(source, CHANNEL), None))
+        elif kind == 'nick':
+            new_nick = '{}_{}'.format(nick, num)
+            traffic.append(('{} NICK :{}'.format(source, new_nick), None))
+        else:
+            traffic.append(('{} PRIVMSG {} :{}'.format(source, CHANNEL, rand.choice(CHATTER)),
+                            None))
+    return traffic
+
+
+def captured_traffic(filename: str) -> list:
+    ''' Load raw lines from a file, and work out which ones should be replied to '''
+    traffic = []
+    with open(filename, 'r', encoding='utf-8', errors='replace') as traffic_file:
+        for line in traffic_file:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            key = None
+            packet = ircp.Packet(line)
+            if (packet.msg_type == 'PRIVMSG' and packet.text and
+                    packet.text.startswith(PREFIX) and len(packet.text) > 1):
+                key = packet.target.lower() if packet.msg_public else packet.sender.lower()
+            traffic.append((line, key))
+    return traffic
+
+
+def add_markers(traffic: list, every: int) -> list:
+    ''' Put a PING marker in after every `every` lines '''
+    marked = []
+    for num, item in enumerate(traffic):
+        if num % every == 0:
+            marker = 'marker-{}'.format(num)
+            marked.append(('PING :{}'.format(marker), 'ping ' + marker))
+        marked.append(item)
+    return marked
+
+
+def percentile(values: list, pct: float) -> float:
+    ''' Nearest-rank percentile of a sorted list '''
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(pct * len(values)))]
+
+
+class FakeServer:
+    ''' Just enough of an IRC server to get the bot registered,
+    replay traffic to it, and time its replies.
+    '''
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.ready = None
+        self.sent = dict()        # reply key -> deque of send times
+        self.latencies = dict()   # 'command'/'ping' -> list of seconds
+        self.waiting = dict()     # marker -> future
+        self.stats = dict()       # The bot's stats, to see what it dropped
+
+    async def start(self):
+        ''' Start listening. Returns the port. '''
+        self.ready = asyncio.get_event_loop().create_future()
+        server = await asyncio.start_server(self.handle_client, '127.0.0.1', 0)
+        return server.sockets[0].getsockname()[1]
+
+    def send(self, line: str):
+        self.writer.write((line + '\r\n').encode())
+
+    async def handle_client(self, reader, writer):
+        ''' Register the bot, then collect its replies '''
+        self.reader, self.writer = reader, writer
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if self.ready.done():
+                self.got_reply(line)
+            elif line.startswith('CAP LS'):
+                self.send(':irc.example.com CAP * LS :')
+            elif line.startswith('CAP END'):
+                self.send(':irc.example.com 001 {} :Welcome to the benchmark'.format(BOT_NICK))
+            elif line.startswith('JOIN'):
+                self.send(':{0}!{0}@bot.example.com JOIN :{1}'.format(BOT_NICK, CHANNEL))
+                self.ready.set_result(True)
+
+    def got_reply(self, line: str):
+        ''' Match a line from the bot up with what it's a reply to '''
+        now = perf_counter()
+        parts = line.split(' ', 2)
+        if len(parts) < 2:
+            return
+
+        if parts[0] == 'PONG':
+            marker = parts[-1].lstrip(':')
+            key, kind = 'ping ' + marker, 'ping'
+        elif parts[0] in ('NOTICE', 'PRIVMSG'):
+            key, kind = parts[1].lower(), 'command'
+        else:
+            return
+
+        times = self.sent.get(key)
+        if times:
+            self.latencies.setdefault(kind, []).append(now - times.popleft())
+            if not times:
+                del self.sent[key]
+
+        future = self.waiting.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(now)
+
+    async def ping(self, marker: str, timeout: float):
+        ''' Send a PING and wait for the PONG. Returns when it came back. '''
+        key = 'ping ' + marker
+        future = asyncio.get_event_loop().create_future()
+        self.waiting[key] = future
+        self.sent.setdefault(key, deque()).append(perf_counter())
+        self.send('PING :{}'.format(marker))
+        return await asyncio.wait_for(future, timeout)
+
+    async def replay(self, traffic: list, rate: float, settle: float) -> dict:
+        ''' Send traffic at `rate` lines per second (0 for no limit),
+        and wait until the bot has caught up.
+        '''
+        self.sent.clear()
+        self.latencies.clear()
+        dropped = self.stats.get('dropped_messages', 0)
+
+        start = perf_counter()
+        position = 0
+        while position < len(traffic):
+            if rate > 0:
+                due = min(len(traffic), int((perf_counter() - start) * rate) + 1)
+            else:
+                due = min(len(traffic), position + WRITE_BATCH)
+
+            now = perf_counter()
+            sent = self.sent
+            for line, key in traffic[position:due]:
+                if key is not None:
+                    if key in sent:
+                        sent[key].append(now)
+                    else:
+                        sent[key] = deque((now,))
+            self.writer.write(''.join(line + '\r\n'
+                                      for line, _ in traffic[position:due]).encode())
+            position = due
+            await self.writer.drain()
+
+            if rate > 0:
+                await asyncio.sleep(max(0.0, start + position / rate - perf_counter()))
+            else:
+                await asyncio.sleep(0)
+        sent_time = perf_counter() - start
+
+        # Lines are handled in order, so once this comes back the bot has
+        # seen everything. Replies from the worker pool may still be coming.
+        done = await self.ping('end', max(30.0, settle))
+        elapsed = done - start
+        await asyncio.sleep(settle)
+        self.latencies['ping'].pop()  # Don't count the end marker
+
+        unanswered = sum(len(times) for times in self.sent.values())
+        self.sent.clear()
+        for values in self.latencies.values():
+            values.sort()
+
+        # Lines the worker pool dropped were never handled, so they don't count
+        dropped = self.stats.get('dropped_messages', 0) - dropped
+        return {
+            'rate': rate,
+            'lines': len(traffic),
+            'send_time': sent_time,
+            'elapsed': elapsed,
+            'throughput': (len(traffic) - dropped) / elapsed,
+            'latencies': dict(self.latencies),
+            'unanswered': unanswered,
+            'dropped': dropped,
+        }
+
+
+def report(result: dict):
+    ''' Print out the results of one replay '''
+    rate = '{:.0f} lines/s'.format(result['rate']) if result['rate'] else 'unlimited rate'
+    print('{}: {} lines handled in {:.2f}s ({:.0f} lines/s)'.format(
+        rate, result['lines'] - result['dropped'], result['elapsed'], result['throughput']))
+    for kind in ('command', 'ping'):
+        values = result['latencies'].get(kind, [])
+        print('  {:8} n={:<6} p50={:8.2f}ms  p99={:8.2f}ms  p999={:8.2f}ms  max={:8.2f}ms'.format(
+            kind, len(values), percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000,
+            percentile(values, 0.999) * 1000, (values[-1] if values else float('nan')) * 1000))
+    if result['unanswered'] or result['dropped']:
+        print('  {} commands were never answered ({} messages dropped by the worker pool)'.format(
+            result['unanswered'], result['dropped']))
+
+
+def sustained(result: dict, slo: float) -> bool:
+    ''' Did the bot keep up with this rate, within the latency target? '''
+    commands = result['latencies'].get('command', [])
+    return (result['throughput'] >= 0.95 * result['rate'] and
+            percentile(commands, 0.99) * 1000 <= slo and
+            result['unanswered'] == 0 and result['dropped'] == 0)
+
+
+def make_bot(port: int, args) -> probot.IRCClient:
+    ''' Set up a bot like main() does, pointed at the fake server '''
+    if not args.online:
+        probot.DISABLED_PLUGINS.update(NETWORK_PLUGINS)
+
+    config = {
+        'nick': BOT_NICK,
+        'password': '',
+        'channels': CHANNEL,
+        'prefix': PREFIX,
+        'admin': 'benchadmin',
+        'adminpass': 'benchpass',
+        'intro': 'Benchmarking!',
+        'oxr_id': '',
+        'address': '127.0.0.1',
+        'port': str(port),
+        'workers': str(args.workers),
+        'send_rate': '1000000',
+        'send_burst': '1000000',
+        'send_queue': '1000000',
+    }
+    shared = probot.setup(config)
+    name, network = next(iter(shared['networks'].items()))
+    client = probot.IRCClient(network['conf']['bot_nick'], network)
+    shared['clients'][name] = client
+    return client
+
+
+async def run(args):
+    ''' Connect the bot to the fake server and run the replays '''
+    server = FakeServer()
+    port = await server.start()
+
+    client = make_bot(port, args)
+    server.stats = client.shared_data['stats']
+    bot = asyncio.ensure_future(client.run_forever())
+    await asyncio.wait_for(server.ready, 10)
+
+    if args.traffic:
+        traffic = captured_traffic(args.traffic)
+    else:
+        traffic = synthetic_traffic(args.lines, args.seed)
+    traffic = add_markers(traffic, MARKER_EVERY)
+
+    results = []
+    if args.sweep:
+        rate = args.rate or 500
+        while True:
+            # Every round replays the same senders, so the last round's
+            # cooldowns would swallow this round's commands
+            client.shared_data['cooldowns'].clear()
+            result = await server.replay(traffic, rate, args.settle)
+            results.append(result)
+            if not sustained(result, args.slo):
+                break
+            rate *= 2
+    else:
+        results.append(await server.replay(traffic, args.rate, args.settle))
+
+    client.stop()
+    client.close()
+    await bot
+    if client.pool is not None:
+        client.pool.shutdown(wait=False)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='number of synthetic lines to replay')
+    parser.add_argument('--traffic', help='replay raw lines from this file instead')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='lines per second to send (0 sends as fast as possible)')
+    parser.add_argument('--sweep', action='store_true',
+                        help='double the rate until the bot can\'t keep up')
+    parser.add_argument('--slo', type=float, default=50.0,
+                        help='p99 command latency (ms) which counts as keeping up')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='size of the bot\'s worker pool (0 handles PRIVMSGs inline)')
+    parser.add_argument('--settle', type=float, default=1.0,
+                        help='seconds to wait for stragglers after each replay')
+    parser.add_argument('--seed', type=int, default=1, help='seed for synthetic traffic')
+    parser.add_argument('--online', action='store_true',
+                        help='leave plugins which use the internet enabled')
+    parser.add_argument('--verbose', action='store_true', help='show the bot\'s output')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    os.chdir(ROOT)  # Plugins load their data relative to here
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        if args.verbose:
+            results = loop.run_until_complete(run(args))
+        else:
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                results = loop.run_until_complete(run(args))
+    finally:
+        loop.close()
+
+    for result in results:
+        report(result)
+
+    if args.sweep:
+        kept_up = [result['rate'] for result in results if sustained(result, args.slo)]
+        if kept_up:
+            print('Max sustainable rate: {:.0f} lines/s (p99 under {:.0f}ms)'.format(
+                max(kept_up), args.slo))
+        else:
+            print('The bot couldn\'t keep up with {:.0f} lines/s'.format(results[0]['rate']))
+    else:
+        print('Max throughput: {:.0f} lines/s'.format(max(r['throughput'] for r in results)))
+        if any(result['dropped'] for result in results):
+            print('Not sustained: the bot dropped messages to keep up')
+
+
+if __name__ == '__main__':
+    main()
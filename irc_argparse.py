@@ -26,7 +26,8 @@ function.
 '''
 
 import re
-import logging
+from collections.abc import Sequence
+from functools import lru_cache
 
 
 SYMBOLS = frozenset('^:,.!@#$%^&*()_+-=[]{}|<>;/?')
@@ -44,15 +45,25 @@ def _pad_str(string, length):
     return string
 
 
-def _is_whitespace(char):
-    ''' Figure out if this character is whitespace or not '''
-    if char in SYMBOLS:
-        return False
-    else:
-        return re.match(r'[\w]', char) is None
+# Word characters are letters, digits, and SYMBOLS. Everything else
+# separates words, including quotes and backslashes outside of quotes.
+_WORD_CLASS = r'\w' + re.escape(''.join(sorted(SYMBOLS)))
 
+# Finds every word when there are no quotes
+WORD_RE = re.compile('[{}]+'.format(_WORD_CLASS))
 
-def parse(args) -> tuple:  # pylint: disable=too-many-branches,too-many-statements
+# Outside of quotes, a line is runs of word characters and runs of separators
+UNQUOTED_RE = re.compile('([{0}]+)|[^{0}]+'.format(_WORD_CLASS))
+
+# Inside of quotes, only quotes and backslashes are special
+QUOTED_RE = re.compile(r'''(['"])|(\\)|[^'"\\]+''')
+
+# How many recently parsed commands to remember
+CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(args) -> tuple:  # pylint: disable=too-many-branches
     ''' Parse a string into separate arguments, while paying
     attention to things such as quotes and escape characters.
     This function parses arguments similar to `sys.argv`.
@@ -61,93 +72,135 @@ def parse(args) -> tuple:  # pylint: disable=too-many-branches,too-many-statemen
     blow up when there are mismatched quotes. This function
     simply ignores mismatched quotes.
 
-    This method disables the pylint `too-many-branches` warning
-    because this problem, by nature, is complex.
+    A quote only starts quoting when it comes right before a word
+    character, and then lasts until the same kind of quote is seen.
+    Inside quotes, a backslash escapes the next character. Outside of
+    quotes, quotes and backslashes separate words just like spaces.
 
     Returns a tuple of words.
     '''
-    logging.debug(args)
-    # Break up words
+    if '"' not in args and "'" not in args:
+        return tuple(WORD_RE.findall(args))
+
     words = []
-    current_word = ''
+    current_word = []
     previous_character = None
     in_word = False
     escape_char = False
     quote_type = None
-
-    for i, ch in enumerate(args):
-        whitespace = _is_whitespace(ch)
-
-        # debug_out = ''
-        # if in_word:
-        #     debug_out = 'i'
-        # else:
-        #     debug_out = 'o'
-
-        # if whitespace:
-        #     debug_out = '{}W'.format(debug_out)
-        #     # logging.debug('W "', end='')
-        # else:
-        #     debug_out = '{}N'.format(debug_out)
-        #     # logging.debug('N "', end='')
-
-        # debug_out = '{} "{}": '.format(debug_out, ch)
-        # logging.debug(debug_out)
-
-        if (not whitespace) or quote_type:
-            if escape_char:
-                current_word += ch
-                escape_char = False
-                logging.debug('escaped by previous char')
-            elif ch == '\\':
-                escape_char = True
-                logging.debug('backslash escapes next')
-            elif ch in QUOTES:
-                if ch == quote_type:
-                    quote_type = None
-                    logging.debug('ended quotes')
-                elif quote_type is None:
-                    if _is_whitespace(previous_character):
-                        quote_type = ch
-                        logging.debug('started quotes')
-                    else:
-                        logging.debug('quotes inside word. ignoring.')
-                elif ch != quote_type:
-                    current_word += ch
-                    logging.debug('character %s', ch)
-                else:
-                    raise Exception('Shouldn\'t have gotten here')
-            else:
-                # buggy fix for quotes within words
+    pos = 0
+    length = len(args)
+
+    while pos < length:
+        if quote_type is None:
+            token = UNQUOTED_RE.match(args, pos)
+            word = token.group(1)
+            if word:
+                # A word right after a quote starts a quoted string
                 if previous_character in QUOTES:
                     quote_type = previous_character
-                    # logging.debug('**', end='')
-
-                current_word += ch
-                logging.debug('character %s', ch)
-            in_word = True
-        elif whitespace and (not quote_type):
-            if in_word:
-                words.append(current_word)
+                current_word.append(word)
+                in_word = True
+            elif in_word:
+                words.append(''.join(current_word))
+                current_word = []
                 in_word = False
-                current_word = ''
-                logging.debug('ended word')
-            else:
-                logging.debug('whitespace has no effect')
-            in_word = False
+
+        elif escape_char:
+            previous_character = args[pos]
+            current_word.append(previous_character)
+            escape_char = False
+            pos += 1
+            continue
+
         else:
-            raise Exception('How did we get here?')
-
-        # last char alive
-        if in_word and i == len(args) - 1:
-            # if quote_type is None:
-            #     logging.debug('Mismatched quotes! Ending anyways!')
-            if whitespace:
-                words.append(current_word)
+            token = QUOTED_RE.match(args, pos)
+            quote, backslash = token.groups()
+            if backslash:
+                escape_char = True
+            elif quote == quote_type:
+                quote_type = None
+            elif quote:
+                current_word.append(quote)
             else:
-                words.append(current_word)
+                # Quoting switches to whichever quote came last
+                if previous_character in QUOTES:
+                    quote_type = previous_character
+                current_word.append(token.group())
 
-        previous_character = ch
+        previous_character = token.group()[-1]
+        pos = token.end()
 
-    print(words)
+    if in_word:
+        words.append(''.join(current_word))
     return tuple(words)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def scan_command(args) -> tuple:
+    ''' Find the first word of `args` without parsing the rest.
+
+    Returns (word, end), where `end` is where the word stops in `args`,
+    or (None, 0) if there aren't any words. The word is always the same
+    as parse(args)[0].
+    '''
+    match = WORD_RE.search(args)
+    if match is None:
+        return None, 0
+
+    start = match.start()
+    if start and args[start - 1] in QUOTES:
+        # The word starts a quoted string, which only parse() gets right.
+        # It's taken to end at the first space after the closing quote.
+        closing = args.find(args[start - 1], start)
+        end = args.find(' ', start if closing < 0 else closing)
+        return parse(args)[0], len(args) if end < 0 else end
+    return match.group(), match.end()
+
+
+class Arguments(Sequence):
+    ''' The words of a command, which acts like the tuple from parse(),
+    but only parses anything once a word past the first is asked for.
+
+    text - the whole command, without the prefix
+    '''
+    __slots__ = ('text', '_command', '_end', '_words')
+
+    def __init__(self, text: str, command: str, end: int):
+        self.text = text
+        self._command = command
+        self._end = end
+        self._words = None
+
+    @property
+    def raw(self) -> str:
+        ''' The text after the first word, as it was typed '''
+        return self.text[self._end:].lstrip()
+
+    @property
+    def words(self) -> tuple:
+        ''' Every word, parsed the first time it's needed '''
+        if self._words is None:
+            self._words = parse(self.text)
+        return self._words
+
+    def __getitem__(self, index):
+        if index == 0:
+            return self._command
+        return self.words[index]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __eq__(self, other):
+        if isinstance(other, Arguments):
+            other = other.words
+        return self.words == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.words)
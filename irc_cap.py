@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+IRCv3 capability negotiation and SASL
+
+This file handles CAP LS/REQ/ACK/END and SASL PLAIN authentication
+during registration, so that we're logged in (and cloaked) before
+registration even finishes. All state is kept in the network's `conf`
+dictionary:
+
+    caps - capabilities the server has ACKed
+    cap_ls - capabilities the server offered (while negotiating)
+    batches - open batches, as reference tag -> batch type
+'''
+
+from base64 import b64encode
+import ircpacket as ircp
+
+
+# Capabilities we ask for whenever the server has them
+WANTED_CAPS = frozenset(('message-tags', 'server-time', 'batch', 'multi-prefix'))
+
+# Batches of old messages which shouldn't trigger any commands
+HISTORY_BATCHES = frozenset(('chathistory', 'znc.in/playback'))
+
+SASL_CHUNK = 400
+SASL_FAILED = frozenset((ircp.numerics.ERR_NICKLOCKED, ircp.numerics.ERR_SASLFAIL,
+                         ircp.numerics.ERR_SASLTOOLONG, ircp.numerics.ERR_SASLABORTED,
+                         ircp.numerics.ERR_SASLALREADY))
+
+
+def reset(conf: dict):
+    ''' Forget about capabilities from a previous connection '''
+    conf['caps'] = set()
+    conf['cap_ls'] = dict()
+    conf['batches'] = dict()
+
+
+def _parse_caps(caps: str) -> dict:
+    ''' Parse "sasl=PLAIN,EXTERNAL multi-prefix" into a dict of cap -> value '''
+    parsed = dict()
+    for cap in caps.split():
+        name, _, value = cap.partition('=')
+        parsed[name] = value
+    return parsed
+
+
+def _wanted(conf: dict) -> set:
+    ''' Get the offered capabilities which we'd like to have '''
+    offered = conf['cap_ls']
+    wanted = set(WANTED_CAPS.intersection(offered))
+
+    mechanisms = offered.get('sasl')
+    if conf['password'] and mechanisms is not None:
+        if not mechanisms or 'PLAIN' in mechanisms.split(','):
+            wanted.add('sasl')
+    return wanted
+
+
+def sasl_plain(nick: str, password: str) -> list:
+    ''' Generate AUTHENTICATE lines for SASL PLAIN '''
+    payload = b64encode('{0}\0{0}\0{1}'.format(nick, password).encode('UTF-8')).decode('ascii')
+    lines = ['AUTHENTICATE {}'.format(payload[i:i + SASL_CHUNK])
+             for i in range(0, len(payload), SASL_CHUNK)]
+
+    # An exact multiple of the chunk size has to be ended with "+"
+    if len(payload) % SASL_CHUNK == 0:
+        lines.append('AUTHENTICATE +')
+    return lines
+
+
+def handle_cap(packet: ircp.Packet, conf: dict):
+    ''' Handle a CAP message from the server '''
+    if len(packet.params) < 3:
+        return None
+
+    subcommand = packet.params[1].upper()
+
+    if subcommand == 'LS':
+        conf['cap_ls'].update(_parse_caps(packet.params[-1]))
+        if packet.params[2] == '*':
+            return None  # More capabilities are on the way
+
+        wanted = _wanted(conf)
+        if wanted:
+            return 'CAP REQ :{}'.format(' '.join(sorted(wanted)))
+        return 'CAP END'
+    elif subcommand == 'ACK':
+        acked = set(packet.params[-1].split())
+        conf['caps'].update(acked)
+        if 'sasl' in acked:
+            return 'AUTHENTICATE PLAIN'
+        return 'CAP END'
+    elif subcommand == 'NAK':
+        return 'CAP END'
+    return None
+
+
+def handle_authenticate(packet: ircp.Packet, conf: dict):
+    ''' Handle the server asking us for our SASL credentials '''
+    if packet.params and packet.params[0] == '+':
+        return sasl_plain(conf['bot_nick'], conf['password'])
+    return None
+
+
+def handle_sasl_numeric(packet: ircp.Packet, conf: dict):
+    ''' Handle SASL success or failure. If SASL fails, logged_in stays
+    False, and we fall back to identifying with NickServ.
+    '''
+    if packet.numeric == ircp.numerics.RPL_SASLSUCCESS:
+        conf['logged_in'] = True
+        return 'CAP END'
+    elif packet.numeric in SASL_FAILED:
+        return 'CAP END'
+    return None
+
+
+def handle_batch(packet: ircp.Packet, conf: dict):
+    ''' Keep track of which batches are open '''
+    if not packet.params:
+        return
+    reference = packet.params[0]
+    if reference.startswith('+') and len(packet.params) > 1:
+        conf['batches'][reference[1:]] = packet.params[1]
+    elif reference.startswith('-'):
+        conf['batches'].pop(reference[1:], None)
+
+
+def is_history(packet: ircp.Packet, conf: dict) -> bool:
+    ''' Is this message part of a batch of old messages being replayed? '''
+    batch = packet.tags.get('batch')
+    return batch is not None and conf['batches'].get(batch) in HISTORY_BATCHES
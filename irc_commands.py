@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''
+Registry of commands
+
+Plugins fill in shared['commands'], shared['help'], shared['cooldown'],
+and shared['cooldown_scope'] as plain dictionaries. Once they're all loaded, build_registry() turns
+those into one CommandSpec per command, so handling a command is a
+single dictionary lookup that gives the handler, its cooldown, who may
+run it, and how it wants its arguments.
+'''
+
+import logging
+
+from irc_cooldown import DEFAULT_SCOPE, SCOPES
+
+
+LOG = logging.getLogger('probot.plugins')
+
+# Cooldown of commands which don't set one
+DEFAULT_COOLDOWN = 5
+
+
+class CommandSpec:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    ''' Everything about one command, and its aliases
+
+    name - the command's own name, as opposed to one of its aliases
+    handler - the function to call, without irctools.require_auth or
+              irctools.require_public wrapped around it
+    cooldown - seconds a user has to wait after running it
+    scope - who the cooldown applies to; see irc_cooldown
+    requires_auth - only bot admins may run it
+    requires_public - it has to be run in a channel
+    args_mode - how the handler gets its arguments; see irctools.lazy_args
+    help - the help text
+    aliases - other names for this command
+    calls - how many times it's been run
+    '''
+    __slots__ = ('name', 'handler', 'cooldown', 'scope', 'requires_auth', 'requires_public',
+                 'args_mode', 'help', 'aliases', 'calls')
+
+    def __init__(self, name: str, handler, cooldown: float, scope: str = DEFAULT_SCOPE,
+                 help_text: str = None):
+        self.name = name
+        self.args_mode = getattr(handler, 'args_mode', None)
+        self.handler, self.requires_auth, self.requires_public = unwrap_checks(handler)
+        self.cooldown = cooldown
+        self.scope = scope
+        self.help = help_text
+        self.aliases = ()
+        self.calls = 0
+
+    def __repr__(self):
+        return '<CommandSpec {}>'.format(self.name)
+
+
+def unwrap_checks(handler) -> tuple:
+    ''' Take off the require_auth and require_public wrappers, so their
+    checks can be done before the command is called instead.
+
+    Returns (handler, requires auth, requires public).
+    '''
+    requires_auth = requires_public = False
+    while True:
+        inner = getattr(handler, '__wrapped__', None)
+        # Checks the wrapper is really ours, and not another decorator
+        # which copied our attributes with functools.wraps
+        if inner is None or inner is not getattr(handler, 'checked', None):
+            return handler, requires_auth, requires_public
+        if handler.requires == 'auth':
+            requires_auth = True
+        elif handler.requires == 'public':
+            requires_public = True
+        handler = inner
+
+
+def resolve_cooldown(name: str, cooldowns: dict) -> float:
+    ''' Get a command's cooldown. A cooldown may be the name of another
+    command to share its cooldown, like {'part': 'join'}.
+    '''
+    value = cooldowns.get(name, DEFAULT_COOLDOWN)
+    if isinstance(value, str):
+        value = cooldowns.get(value, DEFAULT_COOLDOWN)
+    return value
+
+
+def resolve_scope(name: str, scopes: dict) -> str:
+    ''' Get the scope of a command's cooldown '''
+    scope = scopes.get(name, DEFAULT_SCOPE)
+    if scope not in SCOPES:
+        LOG.warning('%s has an unknown cooldown scope %s; using %s', name, scope, DEFAULT_SCOPE)
+        scope = DEFAULT_SCOPE
+    return scope
+
+
+def build_registry(commands: dict, help_texts: dict, cooldowns: dict, scopes: dict,
+                   previous: dict = None) -> dict:
+    ''' Make a dictionary of command name -> CommandSpec. Aliases point to
+    the same CommandSpec as the command they're an alias of.
+
+    A name is an alias when its cooldown is the name of another command
+    with the same handler, like {'w': 'wiki'}. Commands which only share a
+    cooldown, like :join and :part, get their own CommandSpec.
+
+    previous - the last registry, to carry over how often commands were run
+    '''
+    registry = dict()
+    aliases = dict()
+
+    for name, handler in commands.items():
+        target = cooldowns.get(name)
+        if isinstance(target, str) and commands.get(target) is handler:
+            aliases[name] = target
+            continue
+        spec = CommandSpec(name, handler, resolve_cooldown(name, cooldowns),
+                           resolve_scope(name, scopes), help_texts.get(name))
+        if previous is not None and name in previous:
+            spec.calls = previous[name].calls
+        registry[name] = spec
+
+    for alias, target in aliases.items():
+        for _ in range(len(aliases)):
+            if target not in aliases:
+                break
+            target = aliases[target]  # An alias of an alias
+
+        spec = registry.get(target)
+        if spec is None:
+            # Only aliases of each other, so make this one a command
+            LOG.warning('%s is an alias of an alias of itself', alias)
+            spec = CommandSpec(alias, commands[alias], DEFAULT_COOLDOWN,
+                               resolve_scope(alias, scopes), help_texts.get(alias))
+        else:
+            spec.aliases += (alias,)
+        registry[alias] = spec
+
+    return registry
+
+
+def most_used(registry: dict, count: int = 5) -> list:
+    ''' Get the `count` most used commands, as CommandSpecs '''
+    specs = [spec for name, spec in registry.items() if spec.name == name and spec.calls]
+    specs.sort(key=lambda spec: spec.calls, reverse=True)
+    return specs[:count]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''
+Cooldowns for commands and regexes
+
+A cooldown is kept for a key, which depends on its scope:
+    user            - (nick,) - everything the user runs shares a cooldown
+    user_command    - (nick, name) - each user waits between uses of each command
+    channel_command - (channel, name) - the command can be used once per
+                      cooldown in each channel, by anybody
+    global          - (name,) - once per cooldown, anywhere on the network
+
+Cooldowns are kept in an ExpiringDict, so they're thrown out once
+they're over, and there are never more than `capacity` of them.
+'''
+
+from collections import Counter
+from threading import Lock
+from time import time
+
+from irc_expiring import ExpiringDict
+
+
+SCOPES = ('user', 'user_command', 'channel_command', 'global')
+DEFAULT_SCOPE = 'user_command'
+
+# Most cooldowns to keep track of per network
+CAPACITY = 10000
+
+
+def cooldown_key(scope: str, name: str, packet) -> tuple:
+    ''' Figure out which cooldown a use of `name` counts against.
+    Private messages count as their own channel.
+    '''
+    if scope == 'user_command':
+        return (packet.sender, name)
+    elif scope == 'channel_command':
+        return (packet.target if packet.msg_public else packet.sender, name)
+    elif scope == 'global':
+        return (name,)
+    return (packet.sender,)
+
+
+class Cooldowns:
+    ''' Cooldowns for one network
+
+    entries - ExpiringDict of key -> when its cooldown is over
+    throttled - Counter of name -> how many times it was refused because
+                of a cooldown
+    '''
+    def __init__(self, capacity: int = CAPACITY):
+        self.entries = ExpiringDict(capacity=capacity, clock=time)
+        self.throttled = Counter()
+        # Makes checking and starting a cooldown one step
+        self.lock = Lock()
+
+    @property
+    def capacity(self) -> int:
+        ''' Most cooldowns kept track of '''
+        return self.entries.capacity
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        ''' Forget every cooldown '''
+        self.entries.clear()
+
+    def remaining(self, key: tuple, now: float) -> float:
+        ''' Seconds until `key` is off cooldown, or 0 '''
+        when = self.entries.get(key, now=now)
+        return 0.0 if when is None else when - now
+
+    def check(self, name: str, key: tuple, seconds: float, now: float) -> float:
+        ''' Try to use `name`. If `key` is off cooldown, it's put on cooldown
+        for `seconds` and 0 is returned. Otherwise, this counts as a
+        throttled use of `name`, and the seconds left are returned.
+        '''
+        with self.lock:
+            when = self.entries.get(key, now=now)
+            if when is not None:
+                self.throttled[name] += 1
+                return when - now
+            self.entries.set(key, now + seconds, seconds, now)
+            return 0.0
+
+    def penalize(self, key: tuple, seconds: float, now: float):
+        ''' Add `seconds` to a cooldown, or start one if there isn't any '''
+        with self.lock:
+            when = max(self.entries.get(key, now, now), now) + seconds
+            self.entries.set(key, when, when - now, now)
+
+    def most_throttled(self, count: int = 5) -> list:
+        ''' Get (name, times throttled) of what's throttled most often '''
+        return self.throttled.most_common(count)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Event bus for incoming messages
+
+Handlers subscribe to the kinds of message they care about, like JOIN,
+QUIT, or a numeric such as 001, and are called with `(packet, shared)`
+whenever one comes in. Whatever they return is sent back to the server,
+just like the return value of a command.
+
+Routing is a single dictionary lookup on the command, so a line nobody
+subscribed to doesn't need to be parsed at all.
+
+Handlers are run on the event loop, so they need to be quick. Anything
+slow belongs in a command or regex, which run in the worker pool.
+'''
+
+import logging
+from time import perf_counter
+
+
+LOG = logging.getLogger('probot.dispatch')
+
+# Subscribe to this to get every numeric
+ALL_NUMERICS = 'NUMERIC'
+
+# Owner of the bot's own handlers, which stay put when plugins are reloaded
+CORE = 'core'
+
+
+def event_name(event) -> str:
+    ''' Normalize an event to how the command looks on the wire.
+    Numerics may be given as ints, e.g. 1 for '001'.
+    '''
+    if isinstance(event, int):
+        return '{:03}'.format(event)
+    return event.upper()
+
+
+class EventBus:
+    ''' Table of message type -> subscribed handlers
+
+    stats - dictionary of handler name -> [calls, total seconds, slowest call]
+    '''
+    def __init__(self):
+        # Lists of handlers are replaced instead of changed, so plugins can
+        # be reloaded from a worker thread while the event loop dispatches.
+        self.handlers = dict()
+        self.stats = dict()
+
+    def subscribe(self, event, handler, owner=None):
+        ''' Call `handler(packet, shared)` for every `event` message
+
+        event - a command such as 'JOIN', or a numeric (as an int or string)
+        owner - who the handler belongs to; defaults to the handler's module
+        '''
+        event = event_name(event)
+        if owner is None:
+            owner = handler.__module__
+        name = '{}.{}'.format(owner, handler.__name__)
+
+        handlers = self.handlers.get(event, ())
+        self.handlers[event] = handlers + ((owner, name, handler),)
+        self.stats.setdefault(name, [0, 0.0, 0.0])
+        LOG.debug('%s subscribed to %s', name, event)
+
+    def unsubscribe_owner(self, owner: str):
+        ''' Remove every handler that belongs to `owner` '''
+        self.keep(lambda handler_owner: handler_owner != owner)
+
+    def unsubscribe_plugins(self):
+        ''' Remove every handler except the bot's own '''
+        self.keep(lambda handler_owner: handler_owner == CORE)
+
+    def keep(self, wanted):
+        ''' Only keep handlers whose owner passes `wanted(owner)` '''
+        handlers = dict()
+        for event, subscribed in self.handlers.items():
+            subscribed = tuple(entry for entry in subscribed if wanted(entry[0]))
+            if subscribed:
+                handlers[event] = subscribed
+        self.handlers = handlers
+
+    def wants(self, command: str) -> bool:
+        ''' Is anybody subscribed to this command? '''
+        handlers = self.handlers
+        return command in handlers or (ALL_NUMERICS in handlers and command.isdigit())
+
+    def dispatch(self, command: str, packet, shared: dict) -> list:
+        ''' Call everyone subscribed to `command`, in the order they subscribed.
+        Returns a list of their replies. A handler which raises is logged
+        and skipped.
+        '''
+        handlers = self.handlers
+        subscribed = handlers.get(command, ())
+        if command.isdigit() and ALL_NUMERICS in handlers:
+            subscribed += handlers[ALL_NUMERICS]
+
+        replies = []
+        stats = self.stats
+        for _, name, handler in subscribed:
+            start = perf_counter()
+            try:
+                reply = handler(packet, shared)
+            except Exception:
+                # One broken plugin shouldn't cost the others their replies
+                LOG.exception('%s failed handling %s', name, command)
+                reply = None
+            elapsed = perf_counter() - start
+            timing = stats[name]
+            timing[0] += 1
+            timing[1] += elapsed
+            if elapsed > timing[2]:
+                timing[2] = elapsed
+            if reply is not None:
+                replies.append(reply)
+        return replies
+
+    def slowest(self, count: int = 5) -> list:
+        ''' Get (name, calls, average seconds, slowest call) for the
+        handlers which take the longest on average
+        '''
+        timings = [(name, calls, total / calls, slowest)
+                   for name, (calls, total, slowest) in self.stats.items() if calls]
+        timings.sort(key=lambda timing: timing[2], reverse=True)
+        return timings[:count]
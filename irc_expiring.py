@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''
+Dictionaries and sets that forget things
+
+Per-user state (who's logged in, who's on cooldown) would otherwise
+keep an entry for every nick that ever talked to the bot. These keep
+each entry for a limited time, and hold a limited number of them.
+
+Expired entries are thrown out when they're looked up, and on every
+write, which pops whatever has expired off a min-heap of expiry times.
+When full, the entries closest to expiring are dropped first.
+
+LruCache is for caches instead, where the entry to drop when full is
+the one nobody has asked for in the longest time.
+'''
+
+from collections import OrderedDict
+from collections.abc import MutableMapping, MutableSet
+from heapq import heapify, heappop, heappush
+from itertools import count
+from threading import Lock, RLock
+from time import monotonic
+
+
+class ExpiringDict(MutableMapping):
+    ''' A dictionary whose entries expire `ttl` seconds after being set,
+    which holds at most `capacity` of them.
+
+    Entries can be given their own ttl with set(). Times come from `clock`,
+    unless a method is given `now`.
+    '''
+    def __init__(self, ttl: float = None, capacity: int = 1000, clock=monotonic):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self.data = dict()  # key -> (expiry, value)
+        # (expiry, tie breaker, key), including stale entries for keys which
+        # were set again or deleted since. Those are skipped when popped.
+        self.heap = []
+        self.order = count()
+        # Plugins and commands use these from the worker pool
+        self.lock = RLock()
+
+    def set(self, key, value, ttl: float = None, now: float = None):
+        ''' Set `key`, which expires after `ttl` seconds (or the default ttl) '''
+        if now is None:
+            now = self.clock()
+        if ttl is None:
+            ttl = self.ttl
+        expiry = now + ttl if ttl is not None else float('inf')
+
+        with self.lock:
+            self.sweep(now)
+            self.data[key] = (expiry, value)
+            heappush(self.heap, (expiry, next(self.order), key))
+
+            while len(self.data) > self.capacity:
+                self._pop_soonest()
+            if len(self.heap) > 2 * len(self.data) + 16:
+                self._compact()
+
+    def get(self, key, default=None, now: float = None):
+        ''' Get `key`, or `default` if it isn't there or has expired '''
+        entry = self.data.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= (self.clock() if now is None else now):
+            self.data.pop(key, None)
+            return default
+        return entry[1]
+
+    def expiry(self, key):
+        ''' When `key` expires, according to `clock`, or None '''
+        entry = self.data.get(key)
+        return None if entry is None else entry[0]
+
+    def sweep(self, now: float = None):
+        ''' Throw out everything that has expired '''
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            heap = self.heap
+            data = self.data
+            while heap and heap[0][0] <= now:
+                expiry, _, key = heappop(heap)
+                entry = data.get(key)
+                if entry is not None and entry[0] == expiry:
+                    data.pop(key, None)
+
+    def _pop_soonest(self):
+        ''' Drop whichever entry expires first '''
+        while self.heap:
+            expiry, _, key = heappop(self.heap)
+            entry = self.data.get(key)
+            if entry is not None and entry[0] == expiry:
+                self.data.pop(key, None)
+                return
+
+    def _compact(self):
+        ''' Rebuild the heap without stale entries '''
+        self.heap = [(expiry, next(self.order), key)
+                     for key, (expiry, _) in self.data.items()]
+        heapify(self.heap)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.heap.clear()
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __iter__(self):
+        self.sweep()
+        return iter(list(self.data))
+
+    def __len__(self):
+        self.sweep()
+        return len(self.data)
+
+    def __repr__(self):
+        return '<ExpiringDict {}/{}>'.format(len(self), self.capacity)
+
+
+class ExpiringSet(MutableSet):
+    ''' A set whose members expire `ttl` seconds after being added,
+    which holds at most `capacity` of them
+    '''
+    def __init__(self, ttl: float = None, capacity: int = 1000, clock=monotonic):
+        self.members = ExpiringDict(ttl, capacity, clock)
+
+    @property
+    def capacity(self) -> int:
+        ''' Most members this set will hold '''
+        return self.members.capacity
+
+    def add(self, value):
+        self.members.set(value, True)
+
+    def discard(self, value):
+        self.members.pop(value, None)
+
+    def update(self, values):
+        ''' Add everything in `values` '''
+        for value in values:
+            self.add(value)
+
+    def clear(self):
+        self.members.clear()
+
+    def __contains__(self, value):
+        return value in self.members
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __repr__(self):
+        return '<ExpiringSet {}/{}>'.format(len(self), self.capacity)
+
+
+class LruCache(MutableMapping):
+    ''' A cache whose entries expire `ttl` seconds after being set, which
+    holds at most `capacity` of them, dropping the least recently used
+    entry when full.
+
+    Entries can be given their own ttl with set(), e.g. to remember
+    failures for less time. Times come from `clock`, unless a method
+    is given `now`.
+
+    hits - lookups with get() which found something
+    misses - lookups with get() which didn't
+    '''
+    def __init__(self, ttl: float = None, capacity: int = 1000, clock=monotonic):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self.data = OrderedDict()  # key -> (expiry, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def set(self, key, value, ttl: float = None, now: float = None):
+        ''' Set `key`, which expires after `ttl` seconds (or the default ttl) '''
+        if now is None:
+            now = self.clock()
+        if ttl is None:
+            ttl = self.ttl
+        expiry = now + ttl if ttl is not None else float('inf')
+
+        with self.lock:
+            self.data[key] = (expiry, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.capacity:
+                self.data.popitem(last=False)
+
+    def get(self, key, default=None, now: float = None):
+        ''' Get `key`, or `default` if it isn't there or has expired.
+        Counts as a hit or a miss.
+        '''
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] <= now:
+                del self.data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def sweep(self, now: float = None):
+        ''' Throw out everything that has expired '''
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            expired = [key for key, (expiry, _) in self.data.items() if expiry <= now]
+            for key in expired:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.data[key]
+
+    def __contains__(self, key):
+        entry = self.data.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def __iter__(self):
+        self.sweep()
+        return iter(list(self.data))
+
+    def __len__(self):
+        self.sweep()
+        return len(self.data)
+
+    def __repr__(self):
+        return '<LruCache {}/{}>'.format(len(self), self.capacity)
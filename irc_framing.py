@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Line framing for IRC sockets
+
+This file turns the stream of bytes from a socket into IRC lines,
+and IRC lines back into bytes.
+'''
+
+# If a server sends this much without a newline, something is wrong
+MAX_BUFFER = 64 * 1024
+
+
+class LineBuffer:
+    ''' Receive buffer which splits incoming data into lines
+
+    Data is kept in a single bytearray. Each call to `feed` cuts every
+    complete line out of the buffer at once, rather than searching for
+    one terminator at a time.
+    '''
+    __slots__ = ('buffer',)
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def feed(self, data: bytes) -> list:
+        ''' Add data from the socket, and return a list of complete
+        lines (as bytes) with their line endings removed.
+        '''
+        buf = self.buffer
+
+        # Usually a recv ends on a line boundary, so skip the copy
+        if not buf and data.endswith(b'\n'):
+            chunk = data[:-1]
+        else:
+            buf += data
+            end = buf.rfind(b'\n')
+            if end < 0:
+                if len(buf) > MAX_BUFFER:
+                    buf.clear()
+                return []
+
+            with memoryview(buf) as view:
+                chunk = bytes(view[:end])
+            del buf[:end + 1]
+
+        if b'\r' in chunk:
+            return [line.rstrip(b'\r') for line in chunk.split(b'\n')]
+        return chunk.split(b'\n')
+
+    def clear(self):
+        ''' Throw away any partial line '''
+        self.buffer.clear()
+
+
+def encode_lines(lines, encoding='UTF-8') -> list:
+    ''' Encode lines of text into CRLF-terminated bytes '''
+    return [(line + '\r\n').encode(encoding) for line in lines]
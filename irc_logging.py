@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Logging setup for probot
+
+Log records are put on a queue by the bot and written to disk by a
+background thread, so a slow disk never holds up the event loop.
+
+Subsystems log to their own loggers, so each can have its own level:
+    probot          - general bot lifecycle
+    probot.io       - every raw line sent and received (very noisy)
+    probot.dispatch - commands, regexes and protocol handling
+    probot.plugins  - plugin loading
+'''
+
+import logging
+import logging.handlers
+from collections import deque
+from queue import Queue
+
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+class RingBuffer:
+    ''' Remember the last `size` raw lines sent or received, so they
+    can be dumped to the log when something goes wrong. This is much
+    cheaper than logging every line.
+    '''
+    __slots__ = ('lines',)
+
+    def __init__(self, size: int):
+        self.lines = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def append(self, direction: str, line):
+        ''' Record a line. `direction` is either "IN" or "OUT" '''
+        self.lines.append((direction, line))
+
+    def dump(self, logger: logging.Logger, level=logging.ERROR):
+        ''' Write every remembered line to a logger '''
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, 'Last %d lines:', len(self.lines))
+        for direction, line in tuple(self.lines):
+            logger.log(level, '%3s: %s', direction, line)
+
+
+def parse_levels(levels: str) -> dict:
+    ''' Parse per-logger levels of the form "probot.io=DEBUG probot=INFO"
+    into a dictionary.
+    '''
+    parsed = dict()
+    for item in levels.split():
+        name, _, level = item.partition('=')
+        parsed[name] = level.upper()
+    return parsed
+
+
+def setup_logging(filename='probot.log', level='INFO', levels='') -> logging.handlers.QueueListener:
+    ''' Set up logging to `filename` through a background thread
+
+    filename - the file to write logs to
+    level - the default log level
+    levels - per-logger levels (see `parse_levels`)
+
+    Returns the started QueueListener. Call `stop()` on it before
+    exiting so that everything is flushed to disk.
+    '''
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(formatter)
+
+    # Anything really bad still shows up on the console
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    console_handler.setLevel(logging.WARNING)
+
+    queue = Queue()
+    listener = logging.handlers.QueueListener(queue, file_handler, console_handler,
+                                              respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    root.setLevel(level.upper())
+
+    for name, sub_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(sub_level)
+
+    listener.start()
+    return listener
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''
+Matching PRIVMSGs against plugin regexes
+
+Most messages don't match any regex, but used to be searched by every
+one of them anyway. Plugins can tell us what a match needs to contain:
+
+    shared['regex_literals']['url_re'] = ('http', '.')
+
+A regex is only searched if the message (lowercased) contains at least
+one of its literals, so the literals must be lowercase, and every match
+has to contain one of them. Regexes without literals are always searched.
+
+Regexes are tried in order of shared['regex_priority'] (lowest first,
+then in the order they were added), and the first one that matches wins.
+
+Python can't stop a regex halfway through, and a badly written one can
+take seconds on the right message, which holds up the whole bot. So every
+search is timed. A search which takes longer than its budget (in seconds,
+from shared['regex_budget']) is a strike, and a regex with STRIKES strikes
+isn't searched again until plugins are reloaded. A regex can also be given
+a maximum length in shared['regex_max_length'], in which case only that
+many characters from the start of a message are searched.
+'''
+
+import logging
+from time import perf_counter
+
+
+LOG = logging.getLogger('probot.dispatch')
+
+DEFAULT_PRIORITY = 50
+
+# Seconds a single search may take before it counts as a strike
+DEFAULT_BUDGET = 0.05
+
+# How many strikes a regex gets before it's disabled
+STRIKES = 3
+
+
+class RegexIndex:
+    ''' Plugin regexes, in priority order, with a prefilter on literals
+
+    ordered - tuple of (name, compiled regex, max length, budget),
+              in the order they're tried, without disabled regexes
+    literals - tuple of (literal, names of the regexes that need it)
+    always - names of regexes without literals
+    stats - dictionary of name -> [searches, total seconds, slowest search, strikes]
+    disabled - names of regexes which ran out of strikes
+    '''
+    def __init__(self, regexes: dict, literals: dict, priorities: dict,
+                 limits: dict = None, budgets: dict = None, previous=None):
+        limits = limits or dict()
+        budgets = budgets or dict()
+        order = sorted(regexes, key=lambda name: priorities.get(name, DEFAULT_PRIORITY))
+        self.ordered = tuple((name, regexes[name], limits.get(name),
+                              budgets.get(name, DEFAULT_BUDGET)) for name in order)
+
+        by_literal = dict()
+        always = set()
+        for name in order:
+            needed = literals.get(name)
+            if not needed:
+                always.add(name)
+                continue
+            for literal in needed:
+                if literal != literal.lower():
+                    LOG.warning('Literal "%s" of %s should be lowercase', literal, name)
+                    literal = literal.lower()
+                by_literal.setdefault(literal, set()).add(name)
+
+        self.literals = tuple((literal, frozenset(names))
+                              for literal, names in sorted(by_literal.items()))
+        self.always = frozenset(always)
+
+        # Timings carry over a reload, but strikes don't
+        old_stats = previous.stats if previous is not None else dict()
+        self.stats = dict()
+        for name in order:
+            searches, total, slowest, _ = old_stats.get(name, (0, 0.0, 0.0, 0))
+            self.stats[name] = [searches, total, slowest, 0]
+        self.disabled = set()
+
+    def candidates(self, text: str) -> set:
+        ''' Names of the regexes which could match `text` '''
+        lowered = text.lower()
+        found = set(self.always)
+        for literal, names in self.literals:
+            if literal in lowered:
+                found.update(names)
+        return found
+
+    def first_match(self, text: str) -> tuple:
+        ''' Find the first regex to match `text`.
+        Returns (name, match), or (None, None) if nothing matched.
+        '''
+        found = self.candidates(text)
+        if not found:
+            return None, None
+        stats = self.stats
+        for name, regex, limit, budget in self.ordered:
+            if name not in found:
+                continue
+            searched = text if limit is None else text[:limit]
+            start = perf_counter()
+            match = regex.search(searched)
+            elapsed = perf_counter() - start
+
+            timing = stats[name]
+            timing[0] += 1
+            timing[1] += elapsed
+            if elapsed > timing[2]:
+                timing[2] = elapsed
+            if elapsed > budget:
+                self.strike(name, elapsed, len(searched))
+            if match is not None:
+                return name, match
+        return None, None
+
+    def strike(self, name: str, elapsed: float, length: int):
+        ''' Count a search of `name` that went over budget, and disable
+        the regex once it has had too many
+        '''
+        timing = self.stats[name]
+        timing[3] += 1
+        LOG.warning('Regex %s took %.0f ms on a %d character message (strike %d of %d)',
+                    name, elapsed * 1000, length, timing[3], STRIKES)
+        if timing[3] >= STRIKES and name not in self.disabled:
+            LOG.error('Disabling regex %s until plugins are reloaded', name)
+            self.disabled.add(name)
+            # Replaced rather than changed, since other workers may be searching
+            self.ordered = tuple(entry for entry in self.ordered if entry[0] != name)
+
+    def slowest(self, count: int = 5) -> list:
+        ''' Get (name, searches, average seconds, slowest search, strikes)
+        for the regexes with the slowest searches, since one bad message
+        matters more than the average
+        '''
+        timings = [(name, searches, total / searches, slowest, strikes)
+                   for name, (searches, total, slowest, strikes) in self.stats.items()
+                   if searches]
+        timings.sort(key=lambda timing: timing[3], reverse=True)
+        return timings[:count]
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Outbound flood control
+
+IRC servers kill clients that send too many lines too quickly
+(Excess Flood). This file contains a token bucket and a send queue
+which decides what order lines go out in, so that protocol traffic
+isn't stuck behind a wall of NOTICEs.
+'''
+
+from collections import deque, OrderedDict
+from time import monotonic
+
+
+# Priority classes. Lower numbers are sent first.
+PRIORITY_PROTOCOL = 0  # PONG and connection registration
+PRIORITY_AUTH = 1      # NickServ and channel membership
+PRIORITY_NORMAL = 2    # Everything else (replies to users)
+
+PROTOCOL_COMMANDS = frozenset(('PONG', 'PING', 'NICK', 'USER', 'PASS',
+                               'CAP', 'AUTHENTICATE', 'QUIT'))
+AUTH_COMMANDS = frozenset(('JOIN', 'PART', 'MODE'))
+AUTH_TARGETS = frozenset(('nickserv', 'chanserv'))
+
+
+def classify(line: str) -> tuple:
+    ''' Figure out the priority and target of an outgoing line
+
+    Returns a tuple of (priority, target)
+    '''
+    parts = line.split(' ', 2)
+    command = parts[0].upper()
+    target = parts[1] if len(parts) > 1 else ''
+
+    if command in PROTOCOL_COMMANDS:
+        return PRIORITY_PROTOCOL, target
+    elif command in AUTH_COMMANDS or target.lower() in AUTH_TARGETS:
+        return PRIORITY_AUTH, target
+    return PRIORITY_NORMAL, target.lower()
+
+
+class TokenBucket:
+    ''' A token bucket which allows `burst` lines at once, and is
+    refilled at `rate` lines per second.
+    '''
+    __slots__ = ('rate', 'burst', 'tokens', 'last')
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def consume(self) -> bool:
+        ''' Take a token if one is available '''
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self) -> float:
+        ''' Seconds until the next token is available '''
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def reset(self):
+        ''' Fill the bucket back up '''
+        self.tokens = self.burst
+        self.last = monotonic()
+
+
+class SendQueue:
+    ''' Prioritized, bounded queue of outgoing lines
+
+    Protocol and auth lines are sent first, in order. Normal lines are
+    sent round-robin between targets, so one long reply to a user doesn't
+    hold up everybody else.
+
+    When more than `max_lines` normal lines are waiting, the oldest line
+    for the target with the most waiting lines is dropped. Protocol and
+    auth lines are never dropped.
+
+    rate - lines per second allowed on average
+    burst - how many lines may be sent at once
+    max_lines - how many normal lines may be waiting before dropping
+    stats - dictionary to keep `sendq.*` counters in
+    '''
+    def __init__(self, rate=2.0, burst=5, max_lines=100, stats=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_lines = max_lines
+        self.priority = (deque(), deque())
+        self.targets = OrderedDict()
+        self.normal_lines = 0
+
+        self.stats = stats if stats is not None else dict()
+        for counter in ('sendq.queued', 'sendq.sent', 'sendq.dropped'):
+            self.stats.setdefault(counter, 0)
+
+    def __len__(self):
+        return len(self.priority[0]) + len(self.priority[1]) + self.normal_lines
+
+    def push(self, line: str):
+        ''' Add a line to the queue '''
+        priority, target = classify(line)
+        self.stats['sendq.queued'] += 1
+
+        if priority != PRIORITY_NORMAL:
+            self.priority[priority].append(line)
+            return
+
+        if self.normal_lines >= self.max_lines:
+            self._drop()
+
+        if target not in self.targets:
+            self.targets[target] = deque()
+        self.targets[target].append(line)
+        self.normal_lines += 1
+
+    def _drop(self):
+        ''' Drop the oldest line of the biggest target queue '''
+        target = max(self.targets, key=lambda t: len(self.targets[t]))
+        lines = self.targets[target]
+        lines.popleft()
+        if not lines:
+            del self.targets[target]
+        self.normal_lines -= 1
+        self.stats['sendq.dropped'] += 1
+
+    def _pop(self):
+        ''' Remove and return the next line to send '''
+        for lines in self.priority:
+            if lines:
+                return lines.popleft()
+
+        # Round-robin between targets
+        target, lines = self.targets.popitem(last=False)
+        line = lines.popleft()
+        if lines:
+            self.targets[target] = lines
+        self.normal_lines -= 1
+        return line
+
+    def pop_ready(self) -> list:
+        ''' Get all the lines which may be sent right now '''
+        ready = []
+        while len(self) > 0 and self.bucket.consume():
+            ready.append(self._pop())
+        self.stats['sendq.sent'] += len(ready)
+        return ready
+
+    def pop_all(self) -> list:
+        ''' Get every waiting line, ignoring flood control '''
+        ready = []
+        while len(self) > 0:
+            ready.append(self._pop())
+        self.stats['sendq.sent'] += len(ready)
+        return ready
+
+    def delay(self) -> float:
+        ''' Seconds until another line may be sent '''
+        return self.bucket.delay()
+
+    def clear(self):
+        ''' Forget all waiting lines, and start over with a full bucket.
+        This is used when a connection is closed.
+        '''
+        self.bucket.reset()
+        self.priority[0].clear()
+        self.priority[1].clear()
+        self.targets.clear()
+        self.normal_lines = 0
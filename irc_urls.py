@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''
+Finding links in messages
+
+A message is split into words, and only words with a dot or a colon in
+them are looked at. A word is a link if it has an http:// or https://
+scheme and a sensible host, or if it's a bare host like example.com/foo
+whose top level domain is in our list of TLDs.
+
+The list of TLDs is loaded from a file (data/tlds.txt), so it can be
+updated without touching any code.
+
+UrlExtractor.search() works like a compiled regex's search(), so the
+extractor can be used as a plugin regex. Like a regex, it stops at the
+first link; find_urls() gets every one, and find_urls_from() gets every
+one starting from a match search() made.
+
+normalize_url() gives the same link the same spelling, so it can be
+used to look links up in a cache.
+'''
+
+import re
+from string import punctuation
+from urllib.parse import urlsplit, urlunsplit
+
+
+SCHEMES = ('http://', 'https://')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters which only say where a link was found, besides utm_*
+TRACKING_PARAMS = frozenset(('fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid',
+                             'mc_cid', 'mc_eid', '_ga'))
+
+# A link with a scheme: the host (group 1), an optional port, and the rest,
+# which stops at brackets since they don't belong in links
+SCHEME_RE = re.compile(r'https?://([\w.-]+)(?::\d+)?[^<>{}\[\]]*', re.IGNORECASE)
+
+# The same, but only lowercase and anywhere in a line. It starts with a
+# literal, so searching a whole line for it is cheap. The host has to
+# start with a word character, and the link ends at whitespace.
+LINK_RE = re.compile(r'https?://(\w[\w.-]*)[^\s<>{}\[\]]*')
+
+# A link without one: the host (group 1), an optional port (group 2),
+# and then a path, or an @ if it's really an email address (group 3)
+BARE_RE = re.compile(r'([\w.-]+)(:\d+)?(/[^<>{}\[\]]*|@)?')
+
+# Links are often wrapped in these, e.g. (example.com) or "example.com"
+LEADING = punctuation + '«“‘'
+
+# A link can't end in any of these (or an unbalanced parenthesis);
+# they're punctuation around it
+TRAILING = '`!([]{};:\'".,<>?«»“”‘’'
+
+
+def load_tlds(path: str) -> frozenset:
+    ''' Read a list of top level domains, one per line.
+    Blank lines and lines starting with # are skipped.
+    '''
+    with open(path, 'r', encoding='utf-8') as tld_file:
+        return frozenset(line.strip().lower() for line in tld_file
+                         if line.strip() and not line.startswith('#'))
+
+
+def _is_tracking(param: str) -> bool:
+    ''' Is a query parameter (name=value) one of TRACKING_PARAMS? '''
+    name = param.split('=', 1)[0].lower()
+    return name.startswith('utm_') or name in TRACKING_PARAMS
+
+
+def normalize_url(url: str) -> str:
+    ''' Spell a link the same way every time: http:// is added if there's
+    no scheme, the scheme and host are lowercased, default ports and the
+    fragment are dropped, and so are tracking parameters.
+    '''
+    if not url.lower().startswith(SCHEMES):
+        url = 'http://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    netloc = parts.hostname or ''
+    if ':' in netloc:
+        netloc = '[{}]'.format(netloc)  # IPv6
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = '{}:{}'.format(netloc, port)
+
+    query = parts.query
+    if query:
+        query = '&'.join(param for param in query.split('&')
+                         if param and not _is_tracking(param))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def _valid_host(host: str) -> bool:
+    ''' Is every label of `host` non-empty, without leading or trailing dashes? '''
+    return bool(host) and host[0] not in '.-' and host[-1] not in '.-' and \
+        '..' not in host and '.-' not in host and '-.' not in host
+
+
+def _strip_trailing(link: str) -> str:
+    ''' Take punctuation off the end of a link. Closing parentheses stay
+    if they close one in the link, like in a Wikipedia article name.
+    '''
+    if link.count(')') > link.count('('):
+        # Cut the link at the first ) that doesn't close anything
+        closed = 0
+        pos = link.find(')')
+        while pos >= 0:
+            closed += 1
+            if link.count('(', 0, pos) < closed:
+                link = link[:pos]
+                break
+            pos = link.find(')', pos + 1)
+    # Every ) left is balanced, and stops the stripping
+    return link.rstrip(TRAILING)
+
+
+def _words_after(text: str, end: int) -> list:
+    ''' The words in `text` after the one that `end` is in (or just after) '''
+    words = text[end:].split()
+    if words and not text[end].isspace():
+        del words[0]
+    return words
+
+
+class UrlMatch:  # pylint: disable=too-few-public-methods
+    ''' What UrlExtractor.search() found, which looks enough like a regex
+    match for the plugins that only use group(0)
+
+    string - the text that was searched
+    url - the first link in the text
+    after - the words after the one the link was in
+    '''
+    __slots__ = ('string', 'url', 'after')
+
+    def __init__(self, string: str, url: str, after: list):
+        self.string = string
+        self.url = url
+        self.after = after
+
+    def group(self, index=0) -> str:
+        ''' The link. There aren't any other groups. '''
+        if index != 0:
+            raise IndexError('no such group')
+        return self.url
+
+    def __repr__(self):
+        return '<UrlMatch url={!r}>'.format(self.url)
+
+
+class UrlExtractor:
+    ''' Finds links in messages
+
+    tlds - top level domains that links without a scheme can end in
+    '''
+    def __init__(self, tlds: frozenset):
+        self.tlds = frozenset(tld.lower() for tld in tlds)
+
+    def find_urls(self, text: str) -> list:
+        ''' Find every link in `text`, in order, without duplicates '''
+        return self._urls_in(text.split(), [])
+
+    def find_urls_from(self, match) -> list:
+        ''' Every link in the text search() made `match` from, like
+        find_urls(), without reading the words before the first link again
+        '''
+        if isinstance(match, UrlMatch):
+            return self._urls_in(match.after, [match.url])
+        text, end = match.string, match.end()
+        if end == len(text):
+            return [match.group()]
+        return self._urls_in(_words_after(text, end), [match.group()])
+
+    def _urls_in(self, words: list, urls: list) -> list:
+        ''' Add the links in `words` that aren't in `urls` yet '''
+        url_in = self.url_in
+        for word in words:
+            if '.' not in word and ':' not in word:
+                continue
+            url = url_in(word)
+            if url is not None and url not in urls:
+                urls.append(url)
+        return urls
+
+    def search(self, text: str):
+        ''' Find the first link in `text`, or return None. The match's
+        group(0) is the link, and its `string` is `text`. It's the regex
+        match itself when the link didn't need any trimming.
+        '''
+        # Most links are written with a lowercase scheme, which LINK_RE
+        # finds without splitting the line into words. It's only trusted
+        # when no word before it could hold a link, and the word it's in
+        # would be read the same way by url_in().
+        match = LINK_RE.search(text)
+        if match is None or (match.start() and self._link_before(text, match.start())):
+            words = text.split()
+        else:
+            link, host = match.group(0, 1)
+            if ('-' not in host and '..' not in host and host[-1] != '.') or \
+               _valid_host(host.rstrip('.')):
+                if link[-1] in TRAILING or ')' in link:
+                    return UrlMatch(text, _strip_trailing(link),
+                                    _words_after(text, match.end()))
+                return match
+            # Not a link, so carry on after the word it's in
+            words = _words_after(text, match.end())
+
+        url_in = self.url_in
+        for num, word in enumerate(words):
+            if '.' in word or ':' in word:
+                url = url_in(word)
+                if url is not None:
+                    return UrlMatch(text, url, words[num + 1:])
+        return None
+
+    @staticmethod
+    def _link_before(text: str, start: int) -> bool:
+        ''' Could there be a link in `text` before `start`, where LINK_RE
+        matched? It's also true if url_in() would read the word with the
+        match in it some other way.
+        '''
+        before = text[:start]
+        if '.' in before or ':' in before:
+            return True
+        # Like (http://example.com), which url_in() finds unless the link
+        # is stuck to the end of another word
+        return not before[-1].isspace() and \
+            (before[-1].isalnum() or 'http' in before.lower())
+
+    def url_in(self, word: str):
+        ''' Get the link in a single word, if there is one '''
+        if word.startswith(SCHEMES):
+            start = 0
+        elif ':' in word:
+            # Links can be wrapped in something, like <http://example.com>
+            start = word.lower().find('http')
+            if start > 0 and word[start - 1].isalnum():
+                start = -1
+        else:
+            start = -1
+        if start >= 0:
+            match = SCHEME_RE.match(word, start)
+            if match is not None:
+                if not _valid_host(match.group(1).rstrip('.')):
+                    return None
+                link = match.group()
+                if link[-1] in TRAILING or ')' in link:
+                    return _strip_trailing(link)
+                return link
+
+        # No scheme, so it has to look like example.com or example.com/foo
+        if '.' not in word:
+            return None
+        start = 0
+        if word[0] in LEADING:
+            start = len(word) - len(word.lstrip(LEADING))
+            if word[start - 1] == '@':
+                return None
+        match = BARE_RE.match(word, start)
+        if match is None:
+            return None
+        host, port, rest = match.groups()
+        if rest == '@':
+            return None  # An email address
+        if rest is None and port is None:
+            # Whatever comes after a bare host isn't part of the link,
+            # like the full stop at the end of a sentence
+            host = host.rstrip('.-')
+        # It has to end in a TLD we know, which also rules out a host
+        # ending in a dot or dash. LEADING took them off the start.
+        dot = host.rfind('.')
+        if dot < 0:
+            return None
+        tld = host[dot + 1:]
+        if tld not in self.tlds and tld.lower() not in self.tlds:
+            return None
+        if ('-' in host or '..' in host) and not _valid_host(host):
+            return None
+
+        if rest is None:
+            return host if port is None else host + port
+        link = match.group()
+        if link[-1] in TRAILING or ')' in link:
+            return _strip_trailing(link)
+        return link
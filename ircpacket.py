@@ -26,7 +26,6 @@ to make handling IRC a little easier.
 
 
 from collections import namedtuple
-import re
 
 _Numerics = namedtuple('Numerics',
                        ('RPL_WELCOME',
@@ -50,7 +49,16 @@ _Numerics = namedtuple('Numerics',
                         'RPL_MOTD',
                         'RPL_MOTDSTART',
                         'RPL_ENDOFMOTD',
-                        'RPL_HOSTHIDDEN'))
+                        'RPL_HOSTHIDDEN',
+                        'RPL_LOGGEDIN',
+                        'RPL_LOGGEDOUT',
+                        'ERR_NICKLOCKED',
+                        'RPL_SASLSUCCESS',
+                        'ERR_SASLFAIL',
+                        'ERR_SASLTOOLONG',
+                        'ERR_SASLABORTED',
+                        'ERR_SASLALREADY',
+                        'RPL_SASLMECHS'))
 
 numerics = _Numerics(
     RPL_WELCOME=1,
@@ -74,10 +82,86 @@ numerics = _Numerics(
     RPL_MOTD=372,
     RPL_MOTDSTART=375,
     RPL_ENDOFMOTD=376,
-    RPL_HOSTHIDDEN=396
+    RPL_HOSTHIDDEN=396,
+    RPL_LOGGEDIN=900,
+    RPL_LOGGEDOUT=901,
+    ERR_NICKLOCKED=902,
+    RPL_SASLSUCCESS=903,
+    ERR_SASLFAIL=904,
+    ERR_SASLTOOLONG=905,
+    ERR_SASLABORTED=906,
+    ERR_SASLALREADY=907,
+    RPL_SASLMECHS=908
 )
 
 
+def split_params(params: str) -> list:
+    ''' Split the parameters of an IRC message (everything after the
+    command) into a list. The trailing parameter may contain spaces.
+    '''
+    if params.startswith(':'):
+        return [params[1:]]
+    middle, sep, trailing = params.partition(' :')
+    result = middle.split()
+    if sep:
+        result.append(trailing)
+    return result
+
+
+TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+
+def unescape_tag(value: str) -> str:
+    ''' Undo the escaping of an IRCv3 tag value. Unknown escapes lose their
+    backslash, and a backslash at the very end is dropped.
+    '''
+    if '\\' not in value:
+        return value
+    unescaped = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            char = TAG_ESCAPES.get(char, char)
+        unescaped.append(char)
+    return ''.join(unescaped)
+
+
+def parse_tags(tags: str) -> dict:
+    ''' Parse IRCv3 message tags (without the leading @) into a dict.
+    Tags without a value are set to ''.
+    '''
+    parsed = dict()
+    for tag in tags.split(';'):
+        if tag:
+            key, _, value = tag.partition('=')
+            parsed[key] = unescape_tag(value)
+    return parsed
+
+
+# Every numeric a server might send, as the string it arrives as
+NUMERIC_CODES = dict(('{:03}'.format(code), code) for code in range(1000))
+
+CHANNEL_PREFIXES = ('#', '&')
+
+# People tend to say more than one thing, so parsed prefixes are kept
+# around. The cache is emptied whenever it gets too big.
+PREFIX_CACHE = dict()
+PREFIX_CACHE_SIZE = 4096
+
+
+def parse_prefix(prefix: str) -> tuple:
+    ''' Split a message prefix (including the colon) into a tuple of
+    (sender, host, sender_is_user). Servers don't have a sender, and
+    their host is `SERVER`.
+    '''
+    user, at_sign, host = prefix.partition('@')
+    bang = user.find('!')
+    if at_sign and bang > 0:
+        return user[1:bang], host, True
+    return None, 'SERVER', False
+
+
 class Packet:  # pylint: disable=too-many-instance-attributes
     """
     This class interprets an IRC messages' structure
@@ -95,91 +179,114 @@ class Packet:  # pylint: disable=too-many-instance-attributes
     is_action - whether the message is an action such as /me or /describe
     nick_from - with NICK commands, tells what nick the user changed from
     nick_to - with NICK commands, tells what nick the user changed to
+    network - the name of the network this message came from
+    tags - dictionary of IRCv3 message tags (empty if there were none)
+    params - list of every parameter after the command
     """
-    __slots__ = ('sender', 'host', 'target', 'msg_type',
-                 'numeric', 'text', 'is_action', 'nick_to')
+    __slots__ = ('sender', 'host', 'target', 'msg_type', 'msg_public', 'sender_is_user',
+                 'numeric', 'text', 'is_action', 'nick_to', 'network',
+                 '_raw_tags', '_tags', '_rest', '_params')
 
     def __init__(self, message):
-        """message - full message from socket"""
-        self.sender = None
-        self.host = None
-        self.target = None
-        self.msg_type = None
-        self.numeric = None
-        self.text = None
-        self.is_action = None
-        self.nick_to = None
-
-        message_list = message.split(' ', 3)  # split message at each space
-
-        # Check if message is sent by a user
-        message_pt1 = message_list[0]
-
-        try:
-            user_end = message_pt1.index('!')
-            host_begin = message_pt1.index('@') + 1
-            if ('!' in message_pt1) and ('@' in message_pt1):
-                self.sender = message_pt1[1:user_end]
-                self.host = message_pt1[host_begin:]
-        except ValueError:
-            self.host = 'SERVER'
-            if message_pt1 == 'PING' or message_pt1 == 'PONG':
-                print('got a PING')
-                self.host = message.split(':')[1].strip()
-                self.msg_type = message_pt1
-                print('host: {}'.format(self.host))
-                return
-
-        # Make sure message is long enough to parse
-        if not len(message_list) > 1:
-            return
+        """message - full message from socket
 
-        # Attempt to parse message type from packet
-        message_type = message_list[1]
+        The line is read from left to right once:
+        [@tags] [:prefix] command [params...] [:trailing]
+        """
+        self.target = self.numeric = self.text = self.is_action = None
+        self.nick_to = self.network = self._params = self._tags = None
+        self.msg_public = False
 
-        numeric_match = re.match('[0-9]{1,3}', message_type)
-
-        if numeric_match:
-            try:
-                numeric_code = int(message_type)
-                self.numeric = numeric_code
-                self.msg_type = 'NUMERIC'
-            except ValueError:
-                pass
+        if message[:1] == '@':
+            self._raw_tags, _, message = message[1:].partition(' ')
         else:
-            if message_type == 'PRIVMSG':
-                message_target = message_list[2]
-                self.msg_type = message_type
-                self.target = message_target
-            elif message_type == 'JOIN':
-                self.msg_type = message_type
-                self.target = message_list[2][1:]
+            self._raw_tags = ''
+
+        # The prefix is either nick!user@host or a server name
+        if message[:1] == ':':
+            prefix, _, message = message.partition(' ')
+            parsed = PREFIX_CACHE.get(prefix)
+            if parsed is None:
+                if len(PREFIX_CACHE) >= PREFIX_CACHE_SIZE:
+                    PREFIX_CACHE.clear()
+                parsed = PREFIX_CACHE[prefix] = parse_prefix(prefix)
+            self.sender, self.host, self.sender_is_user = parsed
+        else:
+            self.sender = None
+            self.host = 'SERVER'
+            self.sender_is_user = False
+
+        command, _, rest = message.partition(' ')
+        self._rest = rest
+
+        # Most lines are PRIVMSGs, so they're checked for first. Their
+        # target and text are split off directly instead of building params.
+        if command == 'PRIVMSG' or command == 'NOTICE' or command == 'NOTIFY':
+            self.msg_type = command
+            target, _, text = rest.partition(' ')
+            if text[:1] == ':':
+                text = text[1:]
+            elif ' ' in text:
+                text = self.params[-1]  # Not RFC 1459 compliant, but be nice
+
+            if target and command == 'PRIVMSG':
+                self.target = target
+                self.msg_public = target[:1] in CHANNEL_PREFIXES
+
+            if text[:7] == '\001ACTION':
+                # Get rid of the '\001ACTION ' at beginning of message
+                # and the '\001' at end of message
+                self.is_action = True
+                text = text[8:-1] if text[-1:] == '\001' else text[8:]
+            self.text = text
+            return
+
+        if command == 'PING' or command == 'PONG':
+            self.msg_type = command
+            if rest[:1] == ':':
+                self.host = rest[1:]
             else:
-                self.msg_type = message_type
+                params = self.params
+                self.host = params[-1] if params else ''
+            return
 
-        # If IRC message is a message
-        if message_type in ('PRIVMSG', 'NOTIFY', 'NUMERIC', 'NOTICE'):
-            # The [1:] removes the :colon: from the front of the message
-            self.text = message_list[3][1:]
+        numeric = NUMERIC_CODES.get(command)
+        if numeric is not None:
+            self.numeric = numeric
+            self.msg_type = 'NUMERIC'
+            params = self.params
+            if params:
+                self.text = params[-1]
+            return
 
-            # Check if message is an ACTION
-            if self.text[:7] == '\001ACTION':
-                self.is_action = True
-                # Get rid of the '\001ACTION' at beginning of message
-                # And '\001' at end of message
-                self.text = self.text[8:-1]
-        elif message_type == 'NICK':
-            self.nick_to = message_list[2][1:]
+        self.msg_type = command or None
+        if command == 'JOIN':
+            params = self.params
+            if params:
+                self.target = params[0]
+                self.msg_public = True
+        elif command == 'NICK':
+            params = self.params
+            if params:
+                self.nick_to = params[0]
 
     @property
-    def sender_is_user(self):
-        ''' Determine if this event was caused by a user '''
-        return self.host == 'SERVER' or '@' not in self.host
+    def tags(self) -> dict:
+        ''' Dictionary of IRCv3 message tags, parsed the first time it's used '''
+        tags = self._tags
+        if tags is None:
+            tags = self._tags = parse_tags(self._raw_tags) if self._raw_tags else {}
+        return tags
 
     @property
-    def msg_public(self):
-        ''' Is this event public to all users? '''
-        return '#' in self.target
+    def params(self) -> list:
+        ''' List of every parameter after the command. Most handlers never
+        look at these, so they're only split up when asked for.
+        '''
+        params = self._params
+        if params is None:
+            params = self._params = split_params(self._rest)
+        return params
 
     def reply(self, message):
         '''
@@ -206,6 +313,92 @@ class Packet:  # pylint: disable=too-many-instance-attributes
         return make_notice(message, self.sender)
 
 
+FALLBACK_CHARSET = 'latin-1'
+
+
+class RawLine:
+    """
+    A line straight from the socket, which is only decoded as far as needed
+
+    Looking at the command only touches the bytes, so lines which nobody
+    cares about never have to be decoded or parsed. Lines which aren't
+    valid UTF-8 are decoded with the charset set for their channel, or
+    latin-1, instead of raising.
+
+    raw - the line, as bytes, without the line ending
+    charsets - dictionary of (lowercase) channel -> charset to try when
+               a line from that channel isn't UTF-8
+    """
+    __slots__ = ('raw', 'charsets', 'charset', '_command', '_line', '_packet')
+
+    def __init__(self, raw: bytes, charsets=None):
+        self.raw = raw
+        self.charsets = charsets
+        self.charset = None  # What the line was decoded with, once it is
+        self._command = self._line = self._packet = None
+
+    def _skip_prefix(self) -> int:
+        ''' Find where the command starts, past any tags or prefix '''
+        raw = self.raw
+        start = 0
+        if raw[:1] == b'@':
+            start = raw.find(b' ') + 1
+            if start == 0:
+                return len(raw)
+        if raw[start:start + 1] == b':':
+            start = raw.find(b' ', start) + 1
+            if start == 0:
+                return len(raw)
+        return start
+
+    @property
+    def command(self) -> str:
+        ''' The command (PRIVMSG, JOIN, 001...), without decoding the rest '''
+        command = self._command
+        if command is None:
+            start = self._skip_prefix()
+            end = self.raw.find(b' ', start)
+            if end == -1:
+                end = len(self.raw)
+            command = self._command = self.raw[start:end].decode('ascii', 'replace')
+        return command
+
+    def target(self) -> str:
+        ''' The first parameter (e.g. the channel of a PRIVMSG) if there is one '''
+        start = self._skip_prefix()
+        params = self.raw[start:].split(b' ', 2)
+        if len(params) < 2 or params[1][:1] == b':':
+            return None
+        return params[1].decode(FALLBACK_CHARSET)
+
+    @property
+    def line(self) -> str:
+        ''' The whole line as a string '''
+        line = self._line
+        if line is None:
+            try:
+                line = self.raw.decode('utf-8')
+                self.charset = 'utf-8'
+            except UnicodeDecodeError:
+                charset = None
+                if self.charsets:
+                    target = self.target()
+                    if target is not None:
+                        charset = self.charsets.get(target.lower())
+                self.charset = charset or FALLBACK_CHARSET
+                line = self.raw.decode(self.charset, 'replace')
+            self._line = line
+        return line
+
+    @property
+    def packet(self) -> Packet:
+        ''' The line parsed into a Packet '''
+        packet = self._packet
+        if packet is None:
+            packet = self._packet = Packet(self.line)
+        return packet
+
+
 def make_message(message, target, msg_type='PRIVMSG'):
     """
     Format a message to send via PRIVMSG.
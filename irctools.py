@@ -26,6 +26,7 @@ make the life of probot plugin developers easier.
 
 import logging
 import json
+from functools import wraps
 from time import time
 import ircpacket as ircp
 
@@ -37,6 +38,12 @@ CLR_NICK = '11'                # Highlighting for nicks
 CLR_ITLCS = chr(int("0x1d", 0))  # Italics formatting character
 
 
+# What users are told when they can't run a command
+AUTH_REQUIRED = 'You must be an admin to run this command. Please login first with :auth'
+PUBLIC_REQUIRED = ('Sorry, but that command is only available '
+                   'through public chat. Try again in a public channel.')
+
+
 def require_auth(callback):
     ''' Decorator to make it easier for plugins to require authentication
     and restrict usage to bot admins.
@@ -46,13 +53,16 @@ def require_auth(callback):
     def my_fun_command(args: tuple, packet: ircpacket.Packet, shared: dict)
         return packet.reply('You are an admin!')
     '''
+    @wraps(callback)
     def restricted_method(args: tuple, packet: ircp.Packet, shared: dict):  # pylint: disable=missing-docstring
         if packet.sender in shared['auth']:
             return callback(args, packet, shared)
         else:
-            return packet.notice('You must be an admin to run this command. '
-                                 'Please login first with :auth')
+            return packet.notice(AUTH_REQUIRED)
         return None
+    # Lets the command registry do the check itself, see irc_commands
+    restricted_method.requires = 'auth'
+    restricted_method.checked = callback
     return restricted_method
 
 
@@ -65,17 +75,48 @@ def require_public(callback):
     def my_public_command(args: tuple, packet: ircpacket.Packet, shared: dict)
         return packet.reply('This was a public command!')
     '''
+    @wraps(callback)
     def public_method(args: tuple, packet: ircp.Packet, shared: dict):  # pylint: disable=missing-docstring
         if packet.msg_public:
             return callback(args, packet, shared)
         else:
-            return packet.notice('Sorry, but that command is only available '
-                                 'through public chat. Try again in a public channel.')
+            return packet.notice(PUBLIC_REQUIRED)
         return None
 
+    public_method.requires = 'public'
+    public_method.checked = callback
     return public_method
 
 
+def lazy_args(callback):
+    ''' Decorator for commands which don't always need their arguments.
+    Instead of a tuple, `args` is an irc_argparse.Arguments, which is only
+    parsed once something past args[0] is used. `args.raw` is the text
+    after the command name, and never needs parsing.
+
+    usage:
+    @lazy_args
+    def my_echo_command(args: irc_argparse.Arguments, packet: ircpacket.Packet, shared: dict)
+        return packet.reply(args.raw)
+    '''
+    callback.args_mode = 'lazy'
+    return callback
+
+
+def raw_args(callback):
+    ''' Decorator for commands which parse their own arguments.
+    `args` is always a tuple of two strings: the command name and the
+    text after it, as it was typed.
+
+    usage:
+    @raw_args
+    def my_math_command(args: tuple, packet: ircpacket.Packet, shared: dict)
+        return packet.reply(str(eval(args[1])))  # Don't actually do this
+    '''
+    callback.args_mode = 'raw'
+    return callback
+
+
 def load_textfile(filename):
     """Loads multiline message form a text file into a tuple"""
     with open(filename) as textfile:
@@ -106,14 +147,10 @@ def load_json(filename):
     return json_dict
 
 
-def penalize_user(user: str, shared_data: dict):
-    ''' Penalize a user for violating their cooldown '''
-    print('{} has been naughty. Penalizing them now.'.format(user))
-    now = time()
-
-    if (user in shared_data['cooldown_user'] and
-            shared_data['cooldown_user'][user] < now):
-        shared_data['cooldown_user'][user] += 5
-    else:
-        shared_data['cooldown_user'][user] = now + 5
-
+def penalize_user(user: str, shared_data: dict, name: str = None):
+    ''' Penalize a user for violating their cooldown on `name`,
+    or on everything if there's no name (see irc_cooldown)
+    '''
+    logging.getLogger('probot.dispatch').info('%s has been naughty. Penalizing them now.', user)
+    key = (user,) if name is None else (user, name)
+    shared_data['cooldowns'].penalize(key, 5, time())
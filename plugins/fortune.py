@@ -27,6 +27,7 @@ Also supports cowsay (if installed to $PATH)
 import os
 from subprocess import check_output
 import ircpacket as ircp
+from irctools import lazy_args
 
 
 __plugin_description__ = 'Simple fortune utility'
@@ -56,6 +57,7 @@ def which(program: str) -> str:
     return None
 
 
+@lazy_args
 def fortune_command(arg: tuple, packet: ircp.Packet, shared: dict) -> str:
     ''' Tells the user a fortune (maybe via cowsay)
 
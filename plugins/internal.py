@@ -24,7 +24,7 @@ __plugin_type__ = 'command'
 __plugin_enabled__ = True
 
 
-from irctools import CLR_HGLT, CLR_RESET, CLR_NICK, require_auth
+from irctools import CLR_HGLT, CLR_RESET, CLR_NICK, require_auth, lazy_args
 import ircpacket as ircp
 import time
 
@@ -47,6 +47,7 @@ def write_to_log(message, logname='./data/log.txt', text_format='utf-8'):
         logfile.write('[{0}] {1}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S'), message))
 
 
+@lazy_args
 def info_command(arg, packet, shared):
     """
     Displays information about this bot
@@ -83,6 +84,7 @@ def say_command(arg: tuple, packet: ircp.Packet, shared: dict):
                 ircp.make_message(message, target))
 
 
+@lazy_args
 def command_list(arg: tuple, packet: ircp.Packet, shared: dict):
     '''
     Lists all commands
@@ -111,6 +113,7 @@ def command_list(arg: tuple, packet: ircp.Packet, shared: dict):
 #        return ircp.make_notice('You must be admin for this command', packet.sender)
 
 
+@lazy_args
 def test_command(arg, packet, shared):
     """
     Respond to command by telling user that the bot is listening
@@ -184,6 +187,7 @@ def part_command(arg: tuple, packet: ircp.Packet, shared: dict):
 
 
 @require_auth
+@lazy_args
 def list_channels(arg: tuple, packet: ircp.Packet, shared: dict):
     ''' List channels that this bot is currently in '''
     output = None
@@ -20,14 +20,18 @@
 from urllib.parse import urlparse
 from json import loads
 
-import signal
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from html.parser import HTMLParser
+from time import monotonic
+import asyncio
+import codecs
 import re
 import requests
 
-from bs4 import BeautifulSoup
 import ircpacket as ircp
-
-
+from irc_expiring import LruCache
+from irc_urls import UrlExtractor, load_tlds, normalize_url
 
 
 __plugin_description__ = 'Print information about links'
@@ -37,43 +41,6 @@ __plugin_type__ = 'regex'
 __plugin_enabled__ = True
 
 
-# From daringfireball.net, a regex of hell:
-URLREGEX = r"""(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|""" \
-           r"""net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mob""" \
-           r"""i|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|a""" \
-           r"""m|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|b""" \
-           r"""m|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|c""" \
-           r"""n|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|e""" \
-           r"""r|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|g""" \
-           r"""n|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|i""" \
-           r"""o|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|l""" \
-           r"""a|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|m""" \
-           r"""n|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|n""" \
-           r"""o|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|q""" \
-           r"""a|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|s""" \
-           r"""o|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|t""" \
-           r"""p|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|w""" \
-           r"""s|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s(""" \
-           r""")]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s""" \
-           r"""()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?Â«Â»â€œâ€â€˜â€™]""" \
-           r""")|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu""" \
-           r"""|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|na""" \
-           r"""me|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|""" \
-           r"""ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|""" \
-           r"""bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|""" \
-           r"""cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|""" \
-           r"""fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|""" \
-           r"""gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|""" \
-           r"""it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|""" \
-           r"""lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|""" \
-           r"""mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|""" \
-           r"""nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|""" \
-           r"""ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|""" \
-           r"""su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|""" \
-           r"""tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|""" \
-           r"""za|zm|zw)\b/?(?!@)))"""
-
-
 WEBSITES = {'www.youtube.com': '1,0You0,4Tube',
             'youtu.be': '1,0You0,4Tube',
             'kat.cr': '5,8KickassTorrents',
@@ -90,16 +57,143 @@ WEBSITES = {'www.youtube.com': '1,0You0,4Tube',
 
 REQUEST_HEADERS = {'user-agent': 'probot - An IRC Robot (link fetcher plugin)'}
 
+# How long to remember that a link didn't work, in seconds
+NEGATIVE_TTL = 60
+
+# What cached_link_info() gets back from the cache for links it hasn't seen
+_MISSING = object()
+
+# Most of a page to read while looking for its title, in bytes
+TITLE_BYTES = 64 * 1024
+
+# How much of a page to read at a time, in bytes
+CHUNK_BYTES = 8 * 1024
+
+# Longest to spend on a link when there's no deadline, in seconds
+TITLE_DEADLINE = 3
+
+# Longest to spend on all of the links in a message, in seconds
+LINK_DEADLINE = 5
+
+# Most links in one message to look up
+MAX_LINKS = 3
 
-class TimeoutException(Exception):
+# How many links can be fetched at once
+LINK_WORKERS = 4
+
+# How far into a page to look for <meta charset>, like browsers do
+META_PRESCAN = 1024
+
+HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+
+class TitleParser(HTMLParser):
     """
-    Called to limit size of requests
+    Reads HTML as it's fed in, and keeps the text of the <title>.
+    `done` is set once the title is over, or the <body> starts without one.
     """
-    pass
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.in_title = False
+        self.done = False
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'title':
+            self.in_title = True
+        elif tag == 'body':
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self.in_title:
+            self.in_title = False
+            self.done = True
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.parts.append(data)
+
+    def feed(self, data):
+        """ Like HTMLParser.feed, but doesn't bother with anything after </title> """
+        end = data.find('</title')
+        if end < 0:
+            end = data.lower().find('</title')
+        if end >= 0:
+            data = data[:end + 8]
+        super().feed(data)
+
+    @property
+    def title(self):
+        """ The title, with whitespace squashed, or None """
+        return ' '.join(''.join(self.parts).split()) or None
+
+
+def _find_charset(content_type: str, head: bytes) -> str:
+    """
+    Figure out what a page is encoded with, from its Content-Type header,
+    a byte order mark, or a <meta> tag near the start. Defaults to UTF-8.
+    """
+    candidates = []
+    match = HEADER_CHARSET_RE.search(content_type or '')
+    if match is not None:
+        candidates.append(match.group(1))
+    for bom, charset in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                         (codecs.BOM_UTF16_BE, 'utf-16')):
+        if head.startswith(bom):
+            candidates.append(charset)
+    match = META_CHARSET_RE.search(head[:META_PRESCAN])
+    if match is not None:
+        candidates.append(match.group(1).decode('ascii', 'replace'))
+
+    for charset in candidates:
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return 'utf-8'
+
+
+def _read_title(chunks, content_type: str, deadline: float):
+    """
+    Feed a page to a TitleParser a chunk at a time, until the title is
+    found, TITLE_BYTES have been read, or it's past `deadline`.
+    The page is never held in memory all at once.
 
+    chunks - iterable of the bytes of the page, as they arrive
+    deadline - when to give up, according to time.monotonic()
+    """
+    parser = TitleParser()
+    decoder = None
+    head = b''
+    read = 0
 
-def _timeout(signum, frame):
-    raise TimeoutException()
+    for chunk in chunks:
+        chunk = chunk[:TITLE_BYTES - read]
+        read += len(chunk)
+
+        if decoder is not None:
+            parser.feed(decoder.decode(chunk))
+        else:
+            # The charset can't be known until we've seen the <meta> tags
+            head += chunk
+            if len(head) >= META_PRESCAN or read >= TITLE_BYTES:
+                charset = _find_charset(content_type, head)
+                decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+                parser.feed(decoder.decode(head))
+                head = b''
+
+        if parser.done or read >= TITLE_BYTES or monotonic() > deadline:
+            break
+
+    if decoder is None:
+        charset = _find_charset(content_type, head)
+        parser.feed(head.decode(charset, errors='replace'))
+    if not parser.done:
+        parser.close()  # Whatever was left of a cut off title
+    return parser.title
 
 
 def sizeof_fmt(num, suffix='B'):
@@ -115,54 +209,30 @@ def sizeof_fmt(num, suffix='B'):
     return "%.1f %s%s" % (num, 'Yi', suffix)
 
 
-def _get_page_title(link):
+def _time_left(deadline: float) -> float:
     """
-    Get the title of an HTML page
-
-    NOTE - all of the commented out code is old code before I learned of the
-    good 'ol workaround with signals for request sizes. Therefore, it should
-    stay here until this code is deemed to be stable.
+    Seconds until `deadline`, as a timeout for requests
     """
-    signal.signal(signal.SIGALRM, _timeout)
-    signal.alarm(3)
-
-    title = None
-
-    try:
-        r = requests.get(link, headers=REQUEST_HEADERS,
-                         allow_redirects=True, timeout=3)
-
-        if r.status_code != requests.codes.ok:
-            signal.alarm(0)
-            return None
-
-        soup = BeautifulSoup(r.text, 'html.parser')
-        title = soup.title.string
-
-        if title is not None and len(title) > 0:
-            title = title.replace('\n', '')
-            title = title.strip()
+    return max(0.1, deadline - monotonic())
 
-            if len(title) > 100:
-                signal.alarm(0)
-                return '{}...'.format(title[:99])
 
-            signal.alarm(0)
-            return title.strip()
-        else:
-            print('found notitle')
-    except requests.exceptions.ReadTimeout:
-        print('ReadTimeout')
-        signal.alarm(0)
-    except requests.exceptions.Timeout:
-        print('Timeout (Requests)')
-        signal.alarm(0)
-    except TimeoutException:
-        print('Timeout (TimeoutException)')
-        signal.alarm(0)
-    finally:
-        signal.alarm(0)
+def _page_title(page, deadline: float):
+    """
+    Get the title of an HTML page from a streamed response
 
+    The page is only read up to its </title>, so big pages don't cost
+    much. Nothing after the first TITLE_BYTES is read, and reading stops
+    at `deadline`.
+    """
+    # chunk_size=None would hand over the whole body at once when the
+    # server sends a Content-Length, so read in small pieces instead
+    title = _read_title(page.iter_content(chunk_size=CHUNK_BYTES),
+                        page.headers.get('content-type', ''), deadline)
+    if not title:
+        print('found notitle')
+        return None
+    if len(title) > 100:
+        return '{}...'.format(title[:99])
     return title
 
 
@@ -185,15 +255,10 @@ def _is_special_website(page):
     return parse in WEBSITES
 
 
-def _fmt_special_website(page):
+def _fmt_special_website(page, title, deadline):
     RESET = ''
     domain = urlparse(page).netloc.lower()
 
-    title = _get_page_title(page)
-
-    if not title:
-        return None
-
     if domain == 'www.youtube.com' or domain == 'youtu.be':
         ending = ' - YouTube'
         if ending in title:
@@ -238,7 +303,8 @@ def _fmt_special_website(page):
     elif domain == 'paste.hydra.ws' or domain == 'p.hydra.ws':
         if '/api/file/' in page or '/p/' in page:
             key = page.split('/')[-1]
-            r = requests.get('http://paste.hydra.ws/api/file/info/{}'.format(key))
+            r = requests.get('http://paste.hydra.ws/api/file/info/{}'.format(key),
+                             timeout=_time_left(deadline))
 
             if r.status_code == 200:
                 file_info = loads(r.text)
@@ -265,79 +331,146 @@ def _fmt_special_website(page):
         return title
 
 
-def link_info(link):
+def link_info(link, deadline=None):
     """
     Get an information string about a page such as page type and title.
     This function works with webpages and images.
 
+    The page is only requested once: the headers say what it is, and if
+    it's HTML, the title is read from the same response.
+
     link - the webpage to find information about
+    deadline - when to give up, according to time.monotonic()
     """
+    if deadline is None:
+        deadline = monotonic() + TITLE_DEADLINE
     if 'http://' not in link and \
        'https://' not in link:
         link = 'http://{}'.format(link)
 
-    page_head = None
     try:
         print('requesting: {}'.format(link))
-        page_head = requests.head(link, allow_redirects=True, timeout=3)
-        if page_head.status_code == 404:
-            page_head = requests.get(link, allow_redirects=True, timeout=3)
-    except Exception:  # If webpage is NOT a web server
+        page = requests.get(link, headers=REQUEST_HEADERS, allow_redirects=True,
+                            timeout=_time_left(deadline), stream=True)
+    except requests.exceptions.RequestException:  # If webpage is NOT a web server
         print('Connection Refused. Sorry!')
         return None
 
-    content_type = None
     try:
-        content_type = page_head.headers['content-type']
-    except:  # If response header is malformed
-        return None
-
-    # Check if webpage is a website at all
-    if page_head.status_code >= 400:
-        title = _get_page_title(link)
-        if title:
-            return title
-        else:
+        # Check if webpage is a website at all
+        if page.status_code != requests.codes.ok:
             return None
 
-    # Get rid of semicolon in content_type if it's there
-    if ';' in content_type:
-        content_type = content_type.split(';')[0]
-
-    if content_type == 'text/html' and _is_special_website(link):
-        return _fmt_special_website(link)
-    # TODO: DO fun stuff for other types of files like PDFs, DOC files, etc.
-    elif content_type == 'text/html':  # Get page title if it's an HTML page
-        fmt_type = _format_page_type(content_type)
-        page_title = _get_page_title(link)
-        if not page_title:
+        content_type = page.headers.get('content-type')
+        if not content_type:  # If response header is malformed
             return None
-        return '{0} {1}'.format(fmt_type, page_title)
-    else:
-        content_length_bytes = int(page_head.headers['Content-Length'])
+        # Get rid of semicolon in content_type if it's there
+        content_type = content_type.split(';')[0]
         fmt_type = _format_page_type(content_type)
-        content_size = _get_readable_size(content_length_bytes)
-        return '{0} Size: {1}'.format(fmt_type, content_size)
 
+        # TODO: DO fun stuff for other types of files like PDFs, DOC files, etc.
+        if content_type != 'text/html':
+            content_length = page.headers.get('content-length')
+            if content_length is None:
+                return fmt_type
+            content_size = _get_readable_size(int(content_length))
+            return '{0} Size: {1}'.format(fmt_type, content_size)
+
+        page_title = _page_title(page, deadline)
+    finally:
+        page.close()
+
+    if not page_title:
+        return None
+    if _is_special_website(link):
+        return _fmt_special_website(link, page_title, deadline)
+    return '{0} {1}'.format(fmt_type, page_title)
+
+
+def cached_link_info(link, cache: LruCache, deadline=None):
+    """
+    link_info, but remembered. Links which didn't work are remembered
+    too, for NEGATIVE_TTL seconds, so a dead site isn't asked again and
+    again.
+
+    link - the webpage to find information about
+    cache - normalized link -> information string, or None
+    deadline - when to give up, according to time.monotonic()
+    """
+    key = normalize_url(link)
+    info = cache.get(key, _MISSING)
+    if info is not _MISSING:
+        return info
+    if deadline is not None and monotonic() >= deadline:
+        return None  # Too late to start, which says nothing about the link
 
-def matched_url(match, packet: ircp.Packet, shared: dict):
-    ''' Match the url regex '''
-    # At the moment this only cares about the first link in a message
-    matched = match.group(0)
-    print('matched url: {}'.format(matched))
     try:
-        title = link_info(matched)
-        if title is not None:
-            return packet.reply(title)
+        info = link_info(link, deadline)
     except Exception:
-        print('Failed to parse link: {}'.format(matched))
+        print('Failed to parse link: {}'.format(link))
+        info = None
+    cache.set(key, info, ttl=NEGATIVE_TTL if info is None else None)
+    return info
+
+
+async def describe_links(links: list, packet: ircp.Packet, shared: dict):
+    """
+    Look up every link at once, and reply with whatever was found by
+    LINK_DEADLINE, in the order the links were posted.
+
+    Lookups still waiting for a thread are cancelled at the deadline.
+    The ones already running give up by themselves, since they're given
+    the same deadline, and whatever they find is still cached.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = monotonic() + LINK_DEADLINE
+    lookups = [loop.run_in_executor(shared['link_pool'], cached_link_info,
+                                    link, shared['link_cache'], deadline)
+               for link in links]
+    done, pending = await asyncio.wait(lookups, timeout=LINK_DEADLINE)
+    for lookup in pending:
+        lookup.cancel()
+
+    infos = [lookup.result() for lookup in lookups
+             if lookup in done and lookup.exception() is None and lookup.result()]
+    if not infos:
+        return None
+    return packet.reply(' | '.join(infos))
+
+
+def matched_url(match, packet: ircp.Packet, shared: dict):
+    ''' Match the url regex '''
+    links = []
+    seen = set()
+    # The match only has the first link in it; carry on from there
+    for link in shared['regexes']['url_re'].find_urls_from(match):
+        key = normalize_url(link)
+        if key not in seen:
+            seen.add(key)
+            links.append(link)
+    links = links[:MAX_LINKS]
+    print('matched urls: {}'.format(' '.join(links)))
+    # The lookups run on the event loop, so this worker can get back to work
+    return describe_links(links, packet, shared)
 
 
 def setup_resources(config: dict, shared: dict):
-    url_re = re.compile(URLREGEX)
-    shared['regexes']['url_re'] = url_re
+    # Not really a regex, but it has a search() that works like one
+    tlds = load_tlds(path.join(shared['dir'], 'data/tlds.txt'))
+    shared['regexes']['url_re'] = UrlExtractor(tlds)
+
+    # Kept when reloading, unless the size or ttl was changed
+    cache = shared.get('link_cache')
+    if cache is None or cache.capacity != config['link_cache_size'] or \
+       cache.ttl != config['link_cache_ttl']:
+        shared['link_cache'] = LruCache(config['link_cache_ttl'], config['link_cache_size'])
+    if shared.get('link_pool') is None:
+        shared['link_pool'] = ThreadPoolExecutor(max_workers=LINK_WORKERS)
 
     shared['re_response']['url_re'] = matched_url
+    # Links start with http: or https:, or have a dot before the TLD
+    shared['regex_literals']['url_re'] = ('http', '.')
+    shared['regex_priority']['url_re'] = 20
     shared['cooldown']['url_re'] = 10
 
 
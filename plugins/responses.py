@@ -53,7 +53,9 @@ def respond_help(matched, packet: ircp.Packet, shared: dict) -> str:
 
 
 def setup_resources(config: dict, shared: dict):
-    nick = config['bot_nick']
+    # Match any of our nicks, in case we're on several networks
+    nick = '(?:{})'.format('|'.join(re.escape(n) for n in config.get('bot_nicks',
+                                                                      (config['bot_nick'],))))
 
     # Respond to friendly greetings
     greeting_re = re.compile('.*(ha?i|hello|howdy|greetings|salutations|salve|hola|heya?|ahoy)\s(there)?.{{0,3}}{0}'.format(nick),
@@ -78,6 +80,14 @@ def setup_resources(config: dict, shared: dict):
     shared['re_response']['help_re1'] = respond_help
     shared['re_response']['help_re2'] = respond_help
 
+    # Every one of these needs one of our nicks
+    nicks = tuple(n.lower() for n in config.get('bot_nicks', (config['bot_nick'],)))
+    for name in ('greeting_re', 'good_re', 'bad_re', 'help_re1', 'help_re2'):
+        shared['regex_literals'][name] = nicks
+        shared['regex_priority'][name] = 30
+        # The leading .* makes long lines slow, and nobody greets us 200 characters in
+        shared['regex_max_length'][name] = 200
+
     shared['cooldown']['greeting_re'] = 5
     shared['cooldown']['good_re'] = 5
     shared['cooldown']['bad_re'] = 5
@@ -26,8 +26,9 @@ of messages parsed)
 
 
 import datetime
-from irctools import require_auth, CLR_HGLT, CLR_RESET
+from irctools import require_auth, lazy_args, CLR_HGLT, CLR_RESET
 import ircpacket as ircp
+from irc_commands import most_used
 
 _IS_TRACING = False
 try:
@@ -86,6 +87,36 @@ def _uptime(start_time: int) -> str:
     return time_str
 
 
+def _slowest_event(shared: dict) -> str:
+    """ Describe the event handler which takes the longest on average """
+    slowest = shared['events'].slowest(1)
+    if not slowest:
+        return 'none yet'
+    name, calls, average, worst = slowest[0]
+    return '{} ({:.2f} ms average, {:.2f} ms max, {} calls)'.format(
+        name, average * 1000, worst * 1000, calls)
+
+
+def _slowest_regex(shared: dict) -> str:
+    """ Describe the regex with the slowest search """
+    slowest = shared['regex_index'].slowest(1)
+    if not slowest:
+        return 'none yet'
+    name, _, average, worst, __ = slowest[0]
+    return '{} ({:.2f} ms average, {:.2f} ms max), disabled: {}'.format(
+        name, average * 1000, worst * 1000, len(shared['regex_index'].disabled))
+
+
+def _link_cache(shared: dict) -> str:
+    """ Describe how well the link cache is doing """
+    cache = shared.get('link_cache')
+    if cache is None:
+        return 'not in use'
+    return '{} hits, {} misses, {}/{} links'.format(cache.hits, cache.misses,
+                                                   len(cache), cache.capacity)
+
+
+@lazy_args
 def stats_command(__: tuple, packet: ircp.Packet, shared: dict):
     """ Print statistical data about this bot """
     stats = shared['stats']
@@ -96,15 +127,37 @@ def stats_command(__: tuple, packet: ircp.Packet, shared: dict):
     tracing_status = (lambda x: 'enabled' if x else 'disabled')(_IS_TRACING)
     from platform import platform, python_version
 
+    ready_time = shared['conf'].get('ready_time')
+    ready_text = 'unknown' if ready_time is None else '{:.2f} seconds'.format(ready_time)
+
     output = (packet.notice('Current uptime: {}'.format(uptime)),
               packet.notice('Available plugins: {}'.format(stats['plugins.available'])),
               packet.notice('Disabled plugins: {}'.format(stats['plugins.disabled'])),
               packet.notice('Failed plugins: {}'.format(stats['plugins.failed'])),
               packet.notice('Parsed messages: {}'.format(stats['num_messages'])),
+              packet.notice('Ignored lines: {}, not UTF-8: {}'.format(
+                  stats.get('skipped_lines', 0), stats.get('decode_fallbacks', 0))),
+              packet.notice('Slowest event handler: {}'.format(_slowest_event(shared))),
               packet.notice('Commands run: {}'.format(stats['commands_run'])),
+              packet.notice('Cooldowns running: {}, most throttled: {}'.format(
+                  len(shared['cooldowns']), ', '.join(
+                      '{} ({})'.format(name, count)
+                      for name, count in shared['cooldowns'].most_throttled()) or 'nothing')),
+              packet.notice('Most used commands: {}'.format(', '.join(
+                  '{} ({})'.format(spec.name, spec.calls)
+                  for spec in most_used(shared['command_specs'])) or 'none yet')),
               packet.notice('Regex Matches: {}'.format(stats['regex_matches'])),
+              packet.notice('Slowest regex: {}'.format(_slowest_regex(shared))),
+              packet.notice('Link cache: {}'.format(_link_cache(shared))),
+              packet.notice('Lines sent: {}, queued: {}, dropped: {}'.format(
+                  stats.get('sendq.sent', 0), stats.get('sendq.queued', 0),
+                  stats.get('sendq.dropped', 0))),
+              packet.notice('Time from connecting to ready: {}'.format(ready_text)),
               packet.notice('Probot memory usage: {} KB'.format(mem_usage)),
               packet.notice('Bot admins online: {}'.format(len(shared['auth']))),
+              packet.notice('Per-user state: {}/{} logins, {}/{} cooldowns'.format(
+                  len(shared['auth']), shared['auth'].capacity,
+                  len(shared['cooldowns']), shared['cooldowns'].capacity)),
               packet.notice('Memory tracing is {}'.format(tracing_status)),
               packet.notice('Cows: {}:moo{}'.format(CLR_HGLT, CLR_RESET)),
               packet.notice('Platform: {}'.format(platform())),
@@ -113,6 +166,7 @@ def stats_command(__: tuple, packet: ircp.Packet, shared: dict):
     return output
 
 
+@lazy_args
 def uptime_command(__: tuple, packet: ircp.Packet, shared: dict):
     """ Print current uptime """
     start_time = shared['stats']['starttime']
@@ -177,16 +231,42 @@ def memory_obj(args: tuple, packet: ircp.Packet, ___: dict):
         return packet.notice('Sorry, but that object does not exist')
 
 
+@require_auth
+def regexes_command(args: tuple, packet: ircp.Packet, shared: dict):
+    """ List the regexes with the slowest searches """
+    num = 5
+    if len(args) >= 2:
+        try:
+            num = int(args[1])
+        except ValueError:
+            return packet.notice('Your argument must be an integer')
+
+    index = shared['regex_index']
+    slowest = index.slowest(num)
+    if not slowest:
+        return packet.notice('No regexes have been searched yet')
+
+    output = [packet.notice('Slowest {} regexes:'.format(len(slowest)))]
+    for name, searches, average, worst, strikes in slowest:
+        output.append(packet.notice(
+            '{}: {:.2f} ms average, {:.2f} ms max, {} searches, {} strikes{}'.format(
+                name, average * 1000, worst * 1000, searches, strikes,
+                ' (disabled until :reload)' if name in index.disabled else '')))
+    return output
+
+
 def setup_resources(config: dict, shared: dict):
     shared['help']['stats'] = 'Get simple statistics about this bot || :stats'
     shared['help']['uptime'] = 'Get the current uptime for this bot || :uptime'
     shared['help']['memory'] = 'Find the biggest memory hogs (admins only) || :memory [num]'
     shared['help']['memory-obj'] = 'Find the biggest memory hogs (admins only) || :memory-obj <num>'
+    shared['help']['regexes'] = 'List the slowest regexes (admins only) || :regexes [num]'
 
     shared['cooldown']['stats'] = 10
     shared['cooldown']['uptime'] = 3
     shared['cooldown']['memory'] = 3
     shared['cooldown']['memory-obj'] = 3
+    shared['cooldown']['regexes'] = 3
 
 
 def setup_commands(all_commands: dict):
@@ -196,3 +276,4 @@ def setup_commands(all_commands: dict):
     com['uptime'] = uptime_command
     com['memory'] = memory_command
     com['memory-obj'] = memory_obj
+    com['regexes'] = regexes_command
@@ -53,7 +53,10 @@ def sub_replace(match, packet: ircp.Packet, shared: dict) -> str:
     output = ''
 
     print('looking for "{}"'.format(old))
-    for p in reversed(shared['recent_messages']):
+    # Copy the history first, since it may be appended to from another thread
+    for p in reversed(tuple(shared['recent_messages'])):
+        if p is packet:
+            continue
         if p.target == packet.target:
             if p.msg_public and (p.text.find(old) != -1):
                 output = str(p.text)
@@ -82,6 +85,9 @@ def setup_resources(config: dict, shared: dict):
 
     shared['regexes']['sub_re'] = sub_re
     shared['re_response']['sub_re'] = sub_replace
+    # Goes before the others, since s/a.com/b.com/ isn't a link
+    shared['regex_literals']['sub_re'] = ('s/',)
+    shared['regex_priority']['sub_re'] = 10
 
 
 def setup_commands(all_commands: dict):
@@ -47,15 +47,16 @@ from os import path
 import logging
 import ircpacket as ircp
 # IRC color codes that come in handy
-from irctools import CLR_NICK, CLR_HGLT, CLR_RESET, CLR_ITLCS
+from irctools import CLR_NICK, CLR_HGLT, CLR_RESET, CLR_ITLCS, lazy_args, raw_args
 
 
-def hello_world(arg: tuple, packet: ircp.Packet, shared: dict):
+@lazy_args
+def hello_world(arg, packet: ircp.Packet, shared: dict):
     ''' Hello, world!
 
     This is an example template command
 
-    arg - the tuple of keywords
+    arg - the keywords, parsed the first time they're used
     packet - the packet object to receive
     shared - the shared data dictionary
     '''
@@ -64,18 +65,35 @@ def hello_world(arg: tuple, packet: ircp.Packet, shared: dict):
     # You can use this to assign multiple commands to the same function.
     # Different indexes are parsed similarly to how sys.argv is parsed,
     # paying attention to quotes and backslash-escapes.
-    print(arg)
+    print(arg[0])
 
+    # Thanks to @lazy_args, a plain `:hello` never needs anything parsed
+    if arg.raw and len(arg) > 1:
+        return packet.reply('Hello, {}!'.format(arg[1]))
     return packet.reply('Hello, there!')
 
 
+@raw_args
+def echo(arg: tuple, packet: ircp.Packet, shared: dict):
+    ''' Example command which gets its arguments as they were typed
+
+    arg - a tuple of the command name and the text after it
+    '''
+    # Use @raw_args if you'd parse the arguments yourself anyway, and
+    # @lazy_args if you only sometimes look at them. With @lazy_args, arg
+    # acts like the usual tuple, but isn't parsed until you use something
+    # past arg[0]; arg.raw is the text after the command name.
+    # Without either, every word is parsed before your command is called.
+    return packet.reply(arg[1])
+
+
 def setup_resources(config: dict, shared: dict):
     ''' Function to set up data, read configuration, as well
     as create help and cooldown entries.
     '''
     # You are responsible for setting up your help messages here.
     # Help definitions go in shared['help']. This is just a dict
-    shared['help']['hello'] = 'Hello, world! || :hello'
+    shared['help']['hello'] = 'Hello, world! || :hello [name]'
     shared['help']['h'] = 'Alias for :hello'
 
     # For cooldowns, make your master command have a cooldown.
@@ -84,6 +102,11 @@ def setup_resources(config: dict, shared: dict):
     shared['cooldown']['hello'] = 4
     shared['cooldown']['h'] = 'hello'
 
+    # By default, each user has their own cooldown for each command. That
+    # can be changed to 'user' (one cooldown for everything a user runs),
+    # 'channel_command' (once per cooldown in each channel), or 'global'.
+    shared['cooldown_scope']['hello'] = 'channel_command'
+
 def setup_commands(all_commands: dict):
     ''' Function to assign commands to functions.
     '''
@@ -91,3 +114,25 @@ def setup_commands(all_commands: dict):
     # are unsure if you are overwriting anybody else.
     all_commands['hello'] = hello_world
     all_commands['h'] = hello_world
+    all_commands['echo'] = echo
+
+
+def say_welcome(packet: ircp.Packet, shared: dict):
+    ''' Example event handler, called whenever somebody joins a channel
+
+    packet - the JOIN packet
+    shared - the shared data dictionary
+    '''
+    if packet.sender == shared['conf']['bot_nick']:
+        return None
+    return ircp.make_notice('Welcome to {}!'.format(packet.target), packet.sender)
+
+
+def setup_events(events):
+    ''' Optional function to subscribe to messages other than PRIVMSGs,
+    like JOIN, QUIT, or numerics. It's called after setup_commands.
+    '''
+    # Handlers are called with (packet, shared), and whatever they return
+    # is sent, just like a command. They run on the event loop, so they
+    # must not block. Numerics can be given as ints, e.g. 1 for '001'.
+    events.subscribe('JOIN', say_welcome)
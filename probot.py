@@ -28,15 +28,22 @@ The latest version of this source code is at available at
 https://github.com/camconn/probot
 '''
 
-from socket import AF_INET, SOCK_STREAM
+import asyncio
+import codecs
+import json
 import logging
+import os
+import random
+import socket
 import time
-from collections import deque
-import asynchat
-import asyncore
+from collections import deque, OrderedDict
+from collections.abc import MutableMapping
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from inspect import isawaitable
 from os import getcwd, execl
 from os.path import join
-from traceback import format_exc
+from traceback import format_exc, format_exception
 from types import GeneratorType
 from sys import stdout, version_info
 from string import ascii_lowercase
@@ -50,9 +57,19 @@ else:
     from imp import load_module
 
 import ircpacket as ircp  # NOQA
-from irctools import CLR_NICK, CLR_RESET, CLR_HGLT, require_auth, load_json, penalize_user  # NOQA
+from irctools import CLR_NICK, CLR_RESET, CLR_HGLT, require_auth, lazy_args  # NOQA
+from irctools import load_json, AUTH_REQUIRED, PUBLIC_REQUIRED  # NOQA
 import plugins  # NOQA
 import irc_argparse  # NOQA
+from irc_sendqueue import SendQueue  # NOQA
+from irc_framing import LineBuffer, encode_lines  # NOQA
+from irc_logging import RingBuffer, setup_logging  # NOQA
+from irc_events import CORE, EventBus  # NOQA
+from irc_commands import DEFAULT_COOLDOWN, build_registry, resolve_cooldown  # NOQA
+from irc_cooldown import DEFAULT_SCOPE, Cooldowns, cooldown_key  # NOQA
+from irc_expiring import ExpiringSet  # NOQA
+from irc_regexes import RegexIndex  # NOQA
+import irc_cap  # NOQA
 
 # Make sure we don't send spam when send do smilies
 ALLOWABLE_START_CHARS = set(ascii_lowercase)
@@ -60,6 +77,11 @@ BAD_START_CHARS = {'d', 'p', 'o'}
 for ch in BAD_START_CHARS:
     ALLOWABLE_START_CHARS.remove(ch)
 
+LOG = logging.getLogger('probot')
+IO_LOG = logging.getLogger('probot.io')
+DISPATCH_LOG = logging.getLogger('probot.dispatch')
+PLUGIN_LOG = logging.getLogger('probot.plugins')
+
 ALL_PLUGINS = set()       # All plugins as string
 PLUGIN_LIST = set()       # Loaded plugins as modules
 DISABLED_PLUGINS = set()  # Disabled plugins (strings)
@@ -70,6 +92,30 @@ FORMATTING = 'UTF-8'
 
 STOP = 0
 RESTART = 1
+UPGRADE = 2
+
+# Environment variable used to hand connections to a new process
+UPGRADE_ENV = 'PROBOT_UPGRADE'
+
+# How many PRIVMSGs may wait on each worker thread before we drop them
+MAX_PENDING_PER_WORKER = 16
+
+# Reconnection settings (in seconds)
+CONNECT_TIMEOUT = 15
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+STABLE_CONNECTION = 120  # Reset the backoff after staying connected this long
+
+# Seconds added to the cooldown of users who keep triggering a regex on cooldown
+PENALTY = 5
+# Cooldown name for telling people a command doesn't exist
+UNKNOWN_COMMAND = 'unknown command'
+# Most admins that can be logged in at once, per network
+AUTH_CAPACITY = 100
+
+# Keys of the shared data dictionary which each network has its own copy of
+NETWORK_KEYS = frozenset(('network', 'conf', 'chan', 'auth', 'cooldowns',
+                          'recent_messages'))
 
 
 def is_iterable(obj):
@@ -78,87 +124,480 @@ def is_iterable(obj):
             isinstance(obj, GeneratorType) or isinstance(obj, set))
 
 
-class IRCClient(asynchat.async_chat):
+class NetworkShared(MutableMapping):
+    ''' The shared data dictionary, as seen from one network
+
+    Keys in NETWORK_KEYS (the config, channels, auth list, etc.) belong
+    to this network. Every other key is read from and written to the
+    dictionary shared by all networks, so plugins, their data and their
+    caches are only set up once per process.
+    '''
+    __slots__ = ('local', 'shared')
+
+    def __init__(self, local: dict, shared: dict):
+        self.local = local
+        self.shared = shared
+
+    def _owner(self, key):
+        return self.local if key in NETWORK_KEYS else self.shared
+
+    def __getitem__(self, key):
+        return self._owner(key)[key]
+
+    def __setitem__(self, key, value):
+        self._owner(key)[key] = value
+
+    def __delitem__(self, key):
+        del self._owner(key)[key]
+
+    def __contains__(self, key):
+        return key in self._owner(key)
+
+    def __iter__(self):
+        yield from self.local
+        yield from self.shared
+
+    def __len__(self):
+        return len(self.local) + len(self.shared)
+
+
+class IRCClient(asyncio.Protocol):  # pylint: disable=too-many-instance-attributes
     ''' Asyncronous IRC client that handles chat, networking IO,
     and everything else that goes along with that.
+
+    This is an asyncio protocol, so all socket IO is done by the event
+    loop. Handlers may return an awaitable, which is run as a task so
+    the socket keeps being serviced while the handler waits.
+
+    If `shared_data['pool']` is set, PRIVMSGs (commands and regexes) are
+    handled in that thread pool, and their replies are written back from
+    the event loop. Everything else is handled inline.
     '''
     def __init__(self, nick, shared_data):
-        asynchat.async_chat.__init__(self)
-        self.ibuffer = bytes()
-        self.set_terminator(bytes('\r\n', FORMATTING))
+        self.ibuffer = LineBuffer()
         self.nick = nick
         self.shared_data = shared_data
         self.restart = False
         self.trace = False
+        self.loop = None
+        self.transport = None
+        self.closed = None
+        self.tasks = set()
+        self.pool = shared_data.get('pool')
+        self.pending = 0
+        self.max_pending = MAX_PENDING_PER_WORKER * shared_data['conf'].get('workers', 0)
+
+        conf = shared_data['conf']
+        self.sendq = SendQueue(conf.get('send_rate', 2.0), conf.get('send_burst', 5),
+                               conf.get('send_queue', 100), shared_data['stats'])
+        self.flush_handle = None
+        self.ring = RingBuffer(conf.get('log_ring', 100))
+        self.stopped = False
+        self.wakeup = None    # Set when stopped, to cut reconnecting short
+        self.latency = dict()
+        self.resume = None    # Session handed to us by the previous process
+        self.handoff = None   # Session to hand to the next process
 
     def write(self, text):
-        ''' Write some text to the open socket '''
-        print('DEBUG OUT: {}'.format(text))
-        self.push(bytes('{}\r\n'.format(text), FORMATTING))
+        ''' Queue some text to be written to the open socket '''
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.sendq.push(text)
+        if self.flush_handle is None:
+            self.flush()
+
+    def flush(self):
+        ''' Write out as many queued lines as flood control allows,
+        and come back later for the rest.
+        '''
+        self.flush_handle = None
+        if self.transport is None:
+            return
+
+        self.send_lines(self.sendq.pop_ready())
+
+        if len(self.sendq) > 0:
+            self.flush_handle = self.loop.call_later(self.sendq.delay(), self.flush)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.ibuffer.clear()
+
+        if self.resume is not None:
+            self.restore_session(self.resume)
+            self.resume = None
+            return
+
+        # Start from scratch, but remember which channels to go back to
+        conf = self.shared_data['conf']
+        conf['logged_in'] = False
+        conf['joined'] = False
+        conf['connect_time'] = time.time()
+        conf['ready_time'] = None
+        irc_cap.reset(conf)
+        conf['rejoin'].update(self.shared_data['chan'])
+        self.shared_data['chan'].clear()
+
+        self.handle_connect()
 
     def handle_connect(self):
         ''' Responsible for inital connection to the
-        IRC server, as well as setting our nickname
+        IRC server, as well as setting our nickname.
+
+        Capability negotiation is started first, so the server holds
+        registration until we've logged in with SASL (see irc_cap).
         '''
+        self.write('CAP LS 302')
         self.write('NICK {}'.format(self.nick))
         self.write('USER {0} {0} {0} :The best IRC bot around'.format(self.nick))
 
-    def collect_incoming_data(self, data: str):
-        self.ibuffer += data
+    def data_received(self, data: bytes):
+        for line_bytes in self.ibuffer.feed(data):
+            try:
+                self.found_terminator(line_bytes)
+            except Exception:  # pylint: disable=broad-except
+                self.handle_error()
+
+    def found_terminator(self, line_bytes: bytes):
+        ''' Handle a single complete line from the server. Lines are only
+        decoded if something is going to look at them.
+        '''
+        self.ring.append('IN', line_bytes)
+        raw = ircp.RawLine(line_bytes, self.shared_data['conf']['charsets'])
+        if IO_LOG.isEnabledFor(logging.DEBUG):
+            IO_LOG.debug('IN: %s', raw.line)
+
+        command = raw.command
+        if command != 'PRIVMSG' and not self.shared_data['events'].wants(command):
+            stats = self.shared_data['stats']
+            stats['num_messages'] += 1
+            stats['skipped_lines'] += 1
+            return
+
+        packet = raw.packet
+        if raw.charset != 'utf-8':
+            self.shared_data['stats']['decode_fallbacks'] += 1
+            DISPATCH_LOG.debug('Decoded a line as %s', raw.charset)
+
+        offload = self.offload if self.pool is not None else None
+        self.send_reply(handle_incoming(packet, self.shared_data, offload))
+
+    def offload(self, packet: ircp.Packet):
+        ''' Hand a PRIVMSG off to the worker pool. If too many messages
+        are already waiting for a worker, the message is dropped.
+        '''
+        if self.pending >= self.max_pending:
+            DISPATCH_LOG.warning('Worker backlog full; dropping message from %s', packet.sender)
+            self.shared_data['stats']['dropped_messages'] += 1
+            return
+
+        self.pending += 1
+        future = self.loop.run_in_executor(self.pool, handle_privmsg, packet, self.shared_data)
+        future.add_done_callback(partial(self.offload_done, packet))
 
-    def found_terminator(self):
-        line_bytes = self.ibuffer
-        self.ibuffer = bytes()
+    def offload_done(self, packet: ircp.Packet, future):
+        ''' Called on the event loop thread when a worker finishes.
+        The reply goes to whichever network the packet came from.
+        '''
+        self.pending -= 1
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if error is not None:
+            self.handle_error(''.join(format_exception(type(error), error,
+                                                       error.__traceback__)))
+            return
 
-        line = line_bytes.decode(encoding=FORMATTING)
-        print('DEBUG  IN: {}'.format(line))
+        client = self.shared_data['clients'].get(packet.network, self)
+        client.send_reply(future.result())
 
-        reply = handle_incoming(line, self.shared_data)
+    def send_reply(self, reply):
+        ''' Write out a reply from a handler. Awaitable replies are
+        scheduled on the event loop and written once they finish.
+        '''
         if reply is None:
             return
 
         if isinstance(reply, str):
             self.write(reply)
+        elif isawaitable(reply):
+            task = self.loop.create_task(self.await_reply(reply))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
         elif is_iterable(reply):
             for message in reply:
                 if isinstance(message, str):
                     self.write(message)
                 elif isinstance(message, int):
                     self.handlequit(message)
+                else:
+                    self.send_reply(message)  # Replies from several handlers
+
+    async def await_reply(self, awaitable):
+        ''' Wait for a coroutine handler, then send what it returned '''
+        try:
+            reply = await awaitable
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error()
+            return
+
+        if isinstance(reply, int):
+            reply = quit_reply(reply, self.shared_data)
+        self.send_reply(reply)
+
+    def send_lines(self, lines: list):
+        ''' Write a batch of lines to the transport in one go '''
+        if not lines:
+            return
+        ring = self.ring
+        for text in lines:
+            ring.append('OUT', text)
+        if IO_LOG.isEnabledFor(logging.DEBUG):
+            for text in lines:
+                IO_LOG.debug('OUT: %s', text)
+        self.transport.writelines(encode_lines(lines, FORMATTING))
+
+    def stop(self):
+        ''' Stop reconnecting, and wake up run_forever() if it's waiting
+        to reconnect or still connecting. The connection itself is left
+        to the caller.
+        '''
+        self.stopped = True
+        if self.wakeup is not None:
+            self.wakeup.set()
 
     def handlequit(self, flag):
         ''' Method to handle restarts and shutdowns
         '''
         if flag == STOP:
+            self.stop()
             self.close()
         elif flag == RESTART:
-            self.restart = True
-            self.close()
+            # Everything is restarted, not just this network
+            for client in self.shared_data['clients'].values():
+                client.restart = True
+                client.stop()
+                client.close()
+        elif flag == UPGRADE:
+            # Restart, but keep every connection open for the new process
+            for client in self.shared_data['clients'].values():
+                client.restart = True
+                client.stop()
+                if client.transport is not None:
+                    client.loop.create_task(client.detach())
         else:
-            print('Don\'t know what to do with flag value {}'.format(flag))
-            print('So I\'m just gonna quit')
+            LOG.warning('Don\'t know what to do with flag value %s. '
+                        'So I\'m just gonna quit', flag)
+            self.stop()
             self.close()
 
-    def run(self, host, port):
-        ''' Run the client targeted at a host on a port '''
-        self.create_socket(AF_INET, SOCK_STREAM)
-        time.sleep(0.15)
-        self.connect((host, port))
-        time.sleep(0.1)
-        asyncore.loop(65)
+    def close(self):
+        ''' Close the connection once pending output is flushed '''
+        if self.transport is None:
+            return
+
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        # We're leaving anyways, so don't bother with flood control
+        self.send_lines(self.sendq.pop_all())
+        self.transport.close()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if exc is not None:
+            LOG.info('Connection lost: %s', exc)
+
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.sendq.clear()
+
+        for task in self.tasks:
+            task.cancel()
+
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(self.restart)
+
+    def save_session(self, fd: int) -> dict:
+        ''' Get everything the next process needs to pick up this connection '''
+        conf = self.shared_data['conf']
+        return {
+            'network': conf['network'],
+            'fd': fd,
+            'nick': self.nick,
+            'chan': sorted(self.shared_data['chan']),
+            'auth': sorted(self.shared_data['auth']),
+            'logged_in': conf['logged_in'],
+            'caps': sorted(conf['caps']),
+            # Any partial line we've received but not handled yet
+            'buffer': bytes(self.ibuffer.buffer).decode('latin-1'),
+        }
+
+    def restore_session(self, session: dict):
+        ''' Pick up a connection where the previous process left off '''
+        conf = self.shared_data['conf']
+        self.nick = session['nick']
+        conf['bot_nick'] = session['nick']
+        conf['logged_in'] = session['logged_in']
+        conf['joined'] = True
+        irc_cap.reset(conf)
+        conf['caps'].update(session.get('caps', ()))
+        self.shared_data['chan'].update(session['chan'])
+        self.shared_data['auth'].update(session['auth'])
+        self.ibuffer.feed(session['buffer'].encode('latin-1'))
+        LOG.info('Resumed session on %s (%d channels)', conf['network'], len(session['chan']))
+
+    async def detach(self):
+        ''' Stop using this connection without closing it, so that it can
+        be handed to a new process with exec().
+        '''
+        transport = self.transport
+        transport.pause_reading()
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.send_lines(self.sendq.pop_all())
+
+        while self.transport is not None and transport.get_write_buffer_size() > 0:
+            await asyncio.sleep(0.05)
+        if self.transport is None:
+            return  # The server hung up on us in the meantime
+
+        # Closing the transport only closes its file descriptor. The
+        # connection stays open through our inheritable duplicate.
+        sock = transport.get_extra_info('socket')
+        fd = os.dup(sock.fileno())
+        os.set_inheritable(fd, True)
+        self.handoff = self.save_session(fd)
+        transport.close()
+
+    async def resume_connection(self):
+        ''' Use the connection handed to us by the previous process '''
+        session = self.resume
+        self.closed = self.loop.create_future()
+        try:
+            sock = socket.socket(fileno=session['fd'])
+            await self.loop.create_connection(lambda: self, sock=sock)
+        except OSError as error:
+            LOG.warning('Could not resume connection to %s: %s', session['network'], error)
+            self.resume = None
+            return
+        await self.closed
+
+    def ranked_servers(self) -> list:
+        ''' Get this network's servers, fastest to connect to first.
+        Servers we haven't tried yet come after the ones we have, in the
+        order they were configured in.
+        '''
+        servers = self.shared_data['conf']['servers']
+        return sorted(servers, key=lambda server: self.latency.get(server, float('inf')))
+
+    def record_latency(self, server: tuple, seconds: float):
+        ''' Keep a moving average of how long connecting to a server takes '''
+        if server in self.latency:
+            self.latency[server] = 0.7 * self.latency[server] + 0.3 * seconds
+        else:
+            self.latency[server] = seconds
+
+    async def run_forever(self):
+        ''' Stay connected to this network, reconnecting (and trying other
+        servers) whenever the connection drops, until told to stop.
+        Plugins and shared data are left alone between connections.
+
+        Returns whether or not a restart was requested.
+        '''
+        self.loop = asyncio.get_event_loop()
+        self.wakeup = asyncio.Event()
+        if self.stopped:
+            self.wakeup.set()
+        attempt = 0
+
+        if self.resume is not None:
+            await self.resume_connection()
+
+        while not self.stopped:
+            for server in self.ranked_servers():
+                self.closed = self.loop.create_future()
+                start = self.loop.time()
+                try:
+                    finished = await self.unless_stopped(asyncio.wait_for(
+                        self.loop.create_connection(lambda: self, *server), CONNECT_TIMEOUT))
+                except (OSError, asyncio.TimeoutError) as error:
+                    LOG.warning('Could not connect to %s:%s (%s)', server[0], server[1], error)
+                    self.record_latency(server, CONNECT_TIMEOUT)
+                    continue
+                if not finished:
+                    break
+                if self.stopped:
+                    # Told to stop just as the connection went through
+                    self.close()
+                    await self.closed
+                    break
+
+                connected = self.loop.time()
+                self.record_latency(server, connected - start)
+                LOG.info('Connected to %s:%s in %.3f seconds', server[0], server[1],
+                         connected - start)
+
+                await self.closed
+                if self.loop.time() - connected > STABLE_CONNECTION:
+                    attempt = 0
+                break
+
+            if self.stopped:
+                break
+
+            # Full jitter, so that a netsplit doesn't make every bot come back at once
+            delay = random.uniform(1, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+            LOG.info('Reconnecting in %.1f seconds', delay)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
         return self.restart
 
-    def handle_error(self):
+    async def unless_stopped(self, awaitable) -> bool:
+        ''' Wait for `awaitable`, unless the client is stopped first, in
+        which case it's cancelled. Returns whether it finished.
+        '''
+        task = self.loop.create_task(awaitable)
+        stopping = self.loop.create_task(self.wakeup.wait())
+        await asyncio.wait((task, stopping), return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, OSError, asyncio.TimeoutError):
+                pass
+            return False
+        task.result()  # Raises whatever the connection attempt raised
+        return True
+
+    def run(self):
+        ''' Run the client until it is stopped '''
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_forever())
+        finally:
+            loop.close()
+
+    def handle_error(self, trace=None):
         ''' We handle the error here so that we don't
         disconnect from the server. After all, uptime is
         the #1 priority!
         '''
-        trace = format_exc()
+        if trace is None:
+            trace = format_exc()
         try:
-            print(trace)
-            logging.debug('An error occurred...\nHere\'s the traceback:')
-            logging.debug(trace)
-        except Exception:
+            LOG.error('An error occurred...\nHere\'s the traceback:\n%s', trace)
+            self.ring.dump(IO_LOG)
+        except Exception:  # pylint: disable=broad-except
             print('An error broke loose!')
 
 
@@ -171,6 +610,7 @@ def load_builtins(shared: dict):
 
     com['stop'] = stop_command
     com['restart'] = stop_command
+    com['upgrade'] = stop_command
     com['reload'] = reload_command
     com['plugin'] = plugin_info_command
     com['plugins'] = list_plugins
@@ -180,6 +620,8 @@ def load_builtins(shared: dict):
 
     shared['help']['stop'] = 'Stop this bot and make it quit (admins only) || :stop'
     shared['help']['restart'] = 'Stop this bot and make it restart (admins only) || :restart'
+    shared['help']['upgrade'] = ('Restart this bot without disconnecting from IRC '
+                                 '(admins only) || :upgrade')
     shared['help']['reload'] = 'Reload this bot\'s plugins || :reload'
     shared['help']['plugin'] = ('Get information about a plugin '
                                 '|| :plugin <plugin> || :plugin wikipedia')
@@ -190,6 +632,7 @@ def load_builtins(shared: dict):
 
     shared['cooldown']['stop'] = 5
     shared['cooldown']['restart'] = 5
+    shared['cooldown']['upgrade'] = 'restart'
     shared['cooldown']['reload'] = 3
     shared['cooldown']['plugin'] = 2
     shared['cooldown']['plugins'] = 5
@@ -213,6 +656,11 @@ def load_plugins(shared: dict):
     shared['help'].clear()
     shared['regexes'].clear()
     shared['re_response'].clear()
+    shared['regex_literals'].clear()
+    shared['regex_priority'].clear()
+    shared['regex_max_length'].clear()
+    shared['regex_budget'].clear()
+    shared['events'].unsubscribe_plugins()
 
     load_builtins(shared)
 
@@ -224,7 +672,7 @@ def load_plugins(shared: dict):
     else:
         # Python 3.2+
         pl_path = '{}/plugins/__init__.py'.format(getcwd())
-        print('looking in {}'.format(pl_path))
+        PLUGIN_LOG.debug('looking in %s', pl_path)
         py_file = open(pl_path, 'r')
         # The below lines makes flake8 upset. Let's ignore it.
         load_module('plugins', py_file, pl_path, desc)  # NOQA
@@ -236,7 +684,7 @@ def load_plugins(shared: dict):
         ALL_PLUGINS.add(modname)
 
     for modname in ALL_PLUGINS:
-        print('loading {}'.format(modname))
+        PLUGIN_LOG.info('loading %s', modname)
         ALL_PLUGINS.add(modname)
         try:
             module = None
@@ -262,12 +710,11 @@ def load_plugins(shared: dict):
 
                 DISABLED_PLUGINS.add(modname)
             else:
-                print('I found a plugin called "{}" that I didn\'t load.'.format(modname))
+                PLUGIN_LOG.warning('I found a plugin called "%s" that I didn\'t load.', modname)
                 raise ImportError('No __plugin_enabled__ :(')
 
         except ImportError as error:
-            print('Couldn\'t load {}'.format(modname))
-            print('Exception: {}'.format(error))
+            PLUGIN_LOG.warning('Couldn\'t load %s: %s', modname, error)
             DISABLED_PLUGINS.add(modname)
             FAILED_PLUGINS.add(modname)
 
@@ -275,9 +722,18 @@ def load_plugins(shared: dict):
     for plug in PLUGIN_LIST:
         short_name = plug.__name__.lstrip('plugins.')
         if short_name not in DISABLED_PLUGINS:
-            print('setting up {}'.format(plug))
+            PLUGIN_LOG.info('setting up %s', plug.__name__)
             plug.setup_resources(shared['conf'], shared)
             plug.setup_commands(shared['commands'])
+            if hasattr(plug, 'setup_events'):
+                plug.setup_events(shared['events'])
+
+    shared['command_specs'] = build_registry(shared['commands'], shared['help'],
+                                             shared['cooldown'], shared['cooldown_scope'],
+                                             shared['command_specs'])
+    shared['regex_index'] = RegexIndex(shared['regexes'], shared['regex_literals'],
+                                       shared['regex_priority'], shared['regex_max_length'],
+                                       shared['regex_budget'], shared['regex_index'])
 
     # Set up stats
     shared['stats']['plugins.available'] = len(ALL_PLUGINS)
@@ -290,7 +746,7 @@ def reload_command(_: tuple, packet: ircp.Packet, shared: dict):
     '''
     Reloads all plugins as well as their data files
     '''
-    print('Reload command called')
+    PLUGIN_LOG.info('Reload command called')
     load_plugins(shared)
     if len(FAILED_PLUGINS) + len(DISABLED_PLUGINS) == 0:
         return packet.notice('All {} plugins reloaded!'.format(len(PLUGIN_LIST)))
@@ -309,21 +765,26 @@ def reload_command(_: tuple, packet: ircp.Packet, shared: dict):
 
 
 @require_auth
+@lazy_args
 def stop_command(arg: list, packet: ircp.Packet, shared: dict):
     '''
     Stops this bot
     '''
     if arg[0].lower() == 'stop':
-        logging.info('Stop command received; stopping bot.')
+        LOG.info('Stop command received; stopping bot.')
         return STOP
     elif arg[0].lower() == 'restart':
-        logging.info('Restart command received; stopping bot.')
+        LOG.info('Restart command received; stopping bot.')
         return RESTART
+    elif arg[0].lower() == 'upgrade':
+        LOG.info('Upgrade command received; restarting without disconnecting.')
+        return UPGRADE
     else:
-        print('wtf just happened here?')
+        LOG.warning('wtf just happened here?')
 
 
 @require_auth
+@lazy_args
 def list_plugins(arg: tuple, packet: ircp.Packet, shared: dict):
     ''' List all plugins available
 
@@ -411,7 +872,7 @@ def plugin_toggle(arg: tuple, packet: ircp.Packet, shared: dict):
             # TODO: Reload plugins to get rid of leftovers
             return packet.notice('Plugin is now disabled!')
     else:
-        print('You screwed up.')
+        LOG.warning('You screwed up.')
 
 
 # LOL, don't @require_auth here!
@@ -430,46 +891,85 @@ def auth_command(arg: tuple, packet: ircp.Packet, shared: dict):
             return packet.notice('You are already logged in!')
         else:
             shared['auth'].add(packet.sender)
-            print('{} successfully authenticated.'.format(packet.sender))
+            LOG.info('%s successfully authenticated.', packet.sender)
             return packet.notice('Authentication success!')
     else:
         return packet.notice('Authentication failure. Try again later.')
 
 
-def get_cooldown(command: str, now: float, shared: dict):
-    ''' Get the time that a user should be off of their
-    cooldown for using a command
+def network_configs(config: dict) -> list:
+    ''' Get the configuration for each network in a config file
 
-    c - the command
-    now - the current (unix) time (in seconds)
-    shared - shared data dictionary
+    If the config has a "networks" list, each entry is a network, and
+    any key it doesn't set is taken from the top level of the config,
+    except for "name", which defaults to the network's own address.
+    Otherwise, the whole config describes a single network.
     '''
-    cool = now
-
-    if command in shared['cooldown']:
-        value = shared['cooldown'][command]
-
-        # Handle aliases
-        if isinstance(value, str):
-            value = shared['cooldown'][value]
-
-        return cool + value
+    defaults = dict(config)
+    networks = defaults.pop('networks', None)
+    if networks:
+        defaults.pop('name', None)
     else:
-        # Default cooldown is 5 seconds
-        return cool + 5
+        networks = [dict()]
 
+    configs = []
+    for network in networks:
+        net_config = dict(defaults)
+        net_config.update(network)
+        configs.append(net_config)
+    return configs
 
-def setup(config):
-    """
-    Main loop for second thread of program
 
-    config - dictionary of configuration values for probot
-    """
-    m_config = config
+def parse_servers(m_config: dict) -> list:
+    ''' Get the list of (host, port) servers for a network. The main
+    address comes first, followed by the fallbacks in "servers", which
+    look like "irc.example.com:6667 irc2.example.com".
+    '''
+    port = int(m_config['port'])
+    servers = [(m_config['address'], port)]
+    for server in m_config.get('servers', '').split():
+        host, _, server_port = server.partition(':')
+        server = (host, int(server_port) if server_port else port)
+        if server not in servers:
+            servers.append(server)
+    return servers
+
+
+def parse_charsets(m_config: dict) -> dict:
+    ''' Get the charsets to fall back on for channels whose lines aren't
+    UTF-8. These look like "#channel=cp1251 #other=iso-8859-2".
+    '''
+    charsets = dict()
+    for entry in m_config.get('charsets', '').split():
+        channel, _, charset = entry.partition('=')
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            LOG.warning('Unknown charset "%s" for %s; ignoring it', charset, channel)
+            continue
+        charsets[channel.lower()] = charset
+    return charsets
 
-    config = {
+
+def make_conf(m_config: dict) -> dict:
+    ''' Turn the config file entries for one network into the
+    `conf` dictionary used by the bot and plugins.
+    '''
+    return {
+        'network': m_config.get('name', m_config['address']),
+        'address': m_config['address'],
+        'port': int(m_config['port']),
+        'servers': parse_servers(m_config),
+        'rejoin': set(),
+        'joined': False,
+        'connect_time': None,
+        'ready_time': None,
+        'caps': set(),
+        'cap_ls': dict(),
+        'batches': dict(),
         'bot_nick': m_config['nick'],
         'channels': m_config['channels'],
+        'charsets': parse_charsets(m_config),
         'password': m_config['password'],
         'logged_in': False,
         'active': True,
@@ -480,8 +980,43 @@ def setup(config):
         'intro': m_config['intro'],
         'adminpass': m_config['adminpass'],
         'oxr_id': m_config['oxr_id'],
+        'workers': int(m_config.get('workers', 4)),
+        'send_rate': float(m_config.get('send_rate', 2)),
+        'send_burst': int(m_config.get('send_burst', 5)),
+        'send_queue': int(m_config.get('send_queue', 100)),
+        'log_ring': int(m_config.get('log_ring', 100)),
+        'auth_timeout': float(m_config.get('auth_timeout', 86400)),
+        'link_cache_ttl': float(m_config.get('link_cache_ttl', 3600)),
+        'link_cache_size': int(m_config.get('link_cache_size', 500)),
     }
 
+
+def setup(config):
+    """
+    Set up everything the bot needs before connecting
+
+    config - dictionary of configuration values for probot
+
+    Returns the shared data dictionary. `shared['networks']` maps the name
+    of each network to that network's view of the shared data.
+    """
+    net_confs = [make_conf(net_config) for net_config in network_configs(config)]
+    names = [conf['network'] for conf in net_confs]
+    for name in names:
+        if names.count(name) > 1:
+            raise ValueError('More than one network is named "{}"'.format(name))
+    for conf in net_confs:
+        # The send queue divides by the rate, and never sends with no burst
+        if conf['send_rate'] <= 0 or conf['send_burst'] <= 0:
+            raise ValueError('send_rate and send_burst must be positive ({})'.format(
+                conf['network']))
+
+    bot_nicks = sorted(set(conf['bot_nick'] for conf in net_confs))
+    for conf in net_confs:
+        conf['bot_nicks'] = bot_nicks
+
+    config = net_confs[0]
+
     info_str = 'probot version {0}. My owner is {2}{1}{3}.'.format(
         VERSION, config['admin'], CLR_NICK, CLR_RESET)
 
@@ -492,177 +1027,391 @@ def setup(config):
     shared_data = {
         'conf': config,
         'info': info_str,
-        'chan': set(),
         'dir': getcwd(),
         'commands': commands,
+        'command_specs': dict(),
         'help': dict(),
         'regexes': dict(),
         're_response': dict(),
-        'cooldown_user': dict(),
+        'regex_literals': dict(),
+        'regex_priority': dict(),
+        'regex_max_length': dict(),
+        'regex_budget': dict(),
+        'regex_index': RegexIndex({}, {}, {}),
         'cooldown': dict(),
-        'auth': set(),
-        'recent_messages': deque(maxlen=30),
+        'cooldown_scope': dict(),
         'stats': dict(),
+        'pool': None,
+        'networks': OrderedDict(),
+        'clients': dict(),
+        'events': EventBus(),
     }
+    setup_events(shared_data['events'])
+
+    # Each network gets its own config, channels, auth list, and so on
+    for conf in net_confs:
+        local = {
+            'network': conf['network'],
+            'conf': conf,
+            'chan': set(),
+            'auth': ExpiringSet(conf['auth_timeout'], AUTH_CAPACITY),
+            'cooldowns': Cooldowns(),
+            'recent_messages': deque(maxlen=30),
+        }
+        shared_data['networks'][conf['network']] = NetworkShared(local, shared_data)
+
+    # Plugins do blocking IO, so run them in a pool unless workers is 0
+    if config['workers'] > 0:
+        shared_data['pool'] = ThreadPoolExecutor(max_workers=config['workers'])
 
     stats = shared_data['stats']
     stats['num_messages'] = 0
     stats['starttime'] = int(time.time())
     stats['commands_run'] = 0
     stats['regex_matches'] = 0
-    print('stats:')
-    print(shared_data['stats'])
+    stats['dropped_messages'] = 0
+    stats['skipped_lines'] = 0
+    stats['decode_fallbacks'] = 0
 
     # load plugins. This *has* to happend *after* shared_data is set up
     load_plugins(shared_data)
-    print('plugins: {}'.format(PLUGIN_LIST))
+    PLUGIN_LOG.info('plugins: %s', PLUGIN_LIST)
 
     return shared_data
 
 
+def command_args(mode: str, text: str, command: str, end: int):
+    ''' Get the arguments for a command, the way its handler wants them.
+    See irctools.lazy_args and irctools.raw_args.
+    '''
+    if mode == 'lazy':
+        return irc_argparse.Arguments(text, command, end)
+    elif mode == 'raw':
+        return (command, text[end:].lstrip())
+    return irc_argparse.parse(text)
+
+
 def handle_commands(packet: ircp.Packet, shared: dict):
     ''' Handle commands as needed '''
     if not (len(packet.text) > 1 and packet.text[0] == shared['conf']['prefix']):
         return None
 
+    stripped_text = packet.text[1:]
+    # Only look at the first word until we know it's a command
+    command, end = irc_argparse.scan_command(stripped_text)
+    if command is None:
+        return None
+
     now = time.time()
+    cooldowns = shared['cooldowns']
+    c = command.lower()
+    spec = shared['command_specs'].get(c)
+    if spec is None:
+        if (c[0] in ALLOWABLE_START_CHARS and
+                not cooldowns.check(UNKNOWN_COMMAND, (packet.sender, UNKNOWN_COMMAND),
+                                    DEFAULT_COOLDOWN, now)):
+            return packet.notice('Sorry, but the command {1}{0}{2} '
+                                 'does not exist.'.format(c, CLR_HGLT, CLR_RESET))
+        return None
 
-    if (packet.sender not in shared['cooldown_user'] or
-            now > shared['cooldown_user'][packet.sender]):
-        stripped_text = packet.text[1:]
-        words = irc_argparse.parse(stripped_text)
-        if words[0] != '':
-            c = words[0].lower()
-            commands = shared['commands']
-            if c in commands:
-                cool = get_cooldown(c, now, shared)
-                shared['cooldown_user'][packet.sender] = cool
-                reply = commands[c](words, packet, shared)
-                shared['stats']['commands_run'] += 1
-                return reply
-            elif c[0] in ALLOWABLE_START_CHARS:
-                return packet.notice('Sorry, but the command {1}{0}{2} '
-                                     'does not exist.'.format(c, CLR_HGLT, CLR_RESET))
-    else:
-        time_left = (shared['cooldown_user'][packet.sender] - int(now))
+    refusal = None
+    if spec.requires_auth and packet.sender not in shared['auth']:
+        refusal = AUTH_REQUIRED
+    elif spec.requires_public and not packet.msg_public:
+        refusal = PUBLIC_REQUIRED
+    if refusal is not None:
+        # Refusals only count against whoever was refused
+        if cooldowns.check(spec.name, (packet.sender, spec.name), spec.cooldown, now):
+            return None
+        return packet.notice(refusal)
+
+    time_left = cooldowns.check(spec.name, cooldown_key(spec.scope, spec.name, packet),
+                                spec.cooldown, now)
+    if time_left:
         return packet.notice('[Cooldown]: You need to wait for {:.1f} seconds '
-                             'before you can use a command.'.format(time_left))
+                             'before you can use {}{}{} again.'.format(
+                                 time_left, CLR_HGLT, c, CLR_RESET))
+
+    spec.calls += 1
+    reply = spec.handler(command_args(spec.args_mode, stripped_text, command, end),
+                         packet, shared)
+    shared['stats']['commands_run'] += 1
+    return reply
 
 
 def handle_regexes(packet: ircp.Packet, shared: dict):
     ''' Handle regex matching and figuring out the output '''
+    re_name, match = shared['regex_index'].first_match(packet.text)
+    if match is None:
+        return None
+
     now = time.time()
+    scope = shared['cooldown_scope'].get(re_name, DEFAULT_SCOPE)
+    key = cooldown_key(scope, re_name, packet)
+    cooldown = resolve_cooldown(re_name, shared['cooldown'])
+    if shared['cooldowns'].check(re_name, key, cooldown, now):
+        # Penalize users who try to game the system
+        if key[0] == packet.sender:
+            DISPATCH_LOG.info('%s has been naughty. Penalizing them now.', packet.sender)
+            shared['cooldowns'].penalize(key, PENALTY, now)
+        return None
+
+    DISPATCH_LOG.debug('matched to regex "%s"', re_name)
+    shared['stats']['regex_matches'] += 1
+    return shared['re_response'][re_name](match, packet, shared)
+
+
+def quit_reply(flag: int, shared: dict):
+    ''' Say goodbye to every channel, then pass along the quit flag '''
+    if flag == UPGRADE:
+        return [flag]  # We aren't going anywhere
+    reply = [ircp.make_message('kthxbai', c) for c in shared['chan']]
+    reply.append(flag)  # Makes sure to close out.
+    return reply
+
+
+def join_channels(config: dict) -> list:
+    ''' Generate JOINs for our channels, unless we've already joined them '''
+    if config['joined']:
+        return []
+    config['joined'] = True
+    return [ircp.join_chan(c) for c in channels_to_join(config)]
+
+
+def handle_numeric(packet: ircp.Packet, shared: dict):
+    ''' Handle numeric replies from the server '''
+    config = shared['conf']
+
+    reply = irc_cap.handle_sasl_numeric(packet, config)
+    if reply is not None:
+        return reply
+
+    if packet.numeric == ircp.numerics.RPL_WELCOME:
+        # Registration is done. Unless we still have to talk to NickServ
+        # (no SASL), there's no reason to wait for the MOTD to join.
+        if config['logged_in'] or not config['password']:
+            return join_channels(config)
+    elif packet.numeric == ircp.numerics.RPL_ENDOFMOTD:
+        reply = []
+        if config['password'] and not config['logged_in']:
+            reply.append(ircp.make_message('identify {} {}'.format(config['bot_nick'],
+                                                                   config['password']),
+                                           'nickserv'))
+            config['logged_in'] = True  # Stop checking for login numerics
+        reply.extend(join_channels(config))
+        return reply
+    return None
+
+
+def channels_to_join(config: dict) -> list:
+    ''' Get the channels to join once connected. These are the channels
+    in the config, plus any we were in before reconnecting.
+    '''
+    channels = config['channels'].split()
+    channels.extend(sorted(config['rejoin'].difference(channels)))
+    config['rejoin'].clear()
+    return channels
 
 
-    for re_name in shared['regexes']:
-        regex = shared['regexes'][re_name]
-        match = regex.search(packet.text)
+def handle_privmsg(packet: ircp.Packet, shared: dict):
+    ''' Run the command and regex handlers for a PRIVMSG
 
-        if match is not None:
-            # Penalize users who try to game the system
-            if (packet.sender in shared['cooldown_user'] and
-                    now < shared['cooldown_user'][packet.sender]):
-                penalize_user(packet.sender, shared)
-                return None
+    Plugins may block here (HTTP requests, subprocesses, etc.), so
+    this is what gets sent to the worker pool in executor mode.
+    '''
+    # TODO: Let use know they are being penalized for cooldown
+    reply = handle_commands(packet, shared)
+    if reply is None:
+        reply = handle_regexes(packet, shared)
 
-            print('matched to regex "{}"'.format(re_name))
-            shared['stats']['regex_matches'] += 1
-            cool = get_cooldown(re_name, time.time(), shared)
-            shared['cooldown_user'][packet.sender] = cool
-            return shared['re_response'][re_name](match, packet, shared)
+    if isinstance(reply, int):
+        reply = quit_reply(reply, shared)
+    return reply
 
 
-def handle_incoming(line, shared_data):
+def event_cap(packet: ircp.Packet, shared: dict):
+    ''' Capability negotiation '''
+    return irc_cap.handle_cap(packet, shared['conf'])
+
+
+def event_authenticate(packet: ircp.Packet, shared: dict):
+    ''' The server is ready for our SASL credentials '''
+    return irc_cap.handle_authenticate(packet, shared['conf'])
+
+
+def event_batch(packet: ircp.Packet, shared: dict):
+    ''' A batch started or ended '''
+    irc_cap.handle_batch(packet, shared['conf'])
+
+
+def event_ping(packet: ircp.Packet, _: dict):
+    ''' Let the server know we're still here '''
+    return 'PONG {}'.format(packet.host)
+
+
+def event_nick(packet: ircp.Packet, shared: dict):
+    ''' Keep admins logged in when they change their nick '''
+    DISPATCH_LOG.debug('%s changed nick to %s', packet.sender, packet.nick_to)
+    if packet.sender in shared['auth']:
+        shared['auth'].discard(packet.sender)
+        shared['auth'].add(packet.nick_to)
+        LOG.info('moved %s to %s on auth list', packet.sender, packet.nick_to)
+
+
+def event_leave(packet: ircp.Packet, shared: dict):
+    ''' Log admins out when they leave '''
+    if packet.sender in shared['auth']:
+        shared['auth'].discard(packet.sender)
+        LOG.info('removed %s from auth list', packet.sender)
+
+
+def event_join(packet: ircp.Packet, shared: dict):
+    ''' Say hello when we join a channel '''
+    config = shared['conf']
+    if packet.sender != config['bot_nick']:
+        return None
+
+    shared['chan'].add(packet.target)
+    if config['ready_time'] is None and config['connect_time'] is not None:
+        config['ready_time'] = time.time() - config['connect_time']
+        shared['stats']['ready_time'] = config['ready_time']
+        LOG.info('Ready on %s %.3f seconds after connecting',
+                 config['network'], config['ready_time'])
+    return ircp.make_message(config['intro'], packet.target)
+
+
+def setup_events(events: EventBus):
+    ''' Subscribe the bot's own handlers. PRIVMSGs aren't on the bus;
+    handle_incoming sends them to commands and regexes itself.
+    '''
+    events.subscribe('CAP', event_cap, CORE)
+    events.subscribe('AUTHENTICATE', event_authenticate, CORE)
+    events.subscribe('BATCH', event_batch, CORE)
+    events.subscribe('PING', event_ping, CORE)
+    events.subscribe('NICK', event_nick, CORE)
+    events.subscribe('PART', event_leave, CORE)
+    events.subscribe('QUIT', event_leave, CORE)
+    events.subscribe('JOIN', event_join, CORE)
+
+    numerics = ircp.numerics
+    for numeric in ((numerics.RPL_WELCOME, numerics.RPL_ENDOFMOTD, numerics.RPL_SASLSUCCESS) +
+                    tuple(irc_cap.SASL_FAILED)):
+        events.subscribe(numeric, handle_numeric, CORE)
+
+
+def handle_incoming(line, shared_data, offload=None):
     ''' Handles, and replies to incoming IRC messages
 
-    line - the line to parse
+    line - the line to parse, or a Packet it was already parsed into
     shared_data - the shared_data with literally everything in it
+    offload - optional callable which PRIVMSG packets are handed to,
+              instead of being handled inline
+
+    PRIVMSGs go to commands and regexes. Everything else goes to
+    whoever subscribed to it on `shared_data['events']`.
     '''
     config = shared_data['conf']
-    reply = None  # Reset reply
-    msg_packet = ircp.Packet(line)
+    replies = []
+    msg_packet = line if isinstance(line, ircp.Packet) else ircp.Packet(line)
+    msg_packet.network = shared_data['network']
 
-    # Determine if prefix is at beginning of message
-    # If it is, then parse for commands
     if msg_packet.msg_type == 'PRIVMSG':
-        # TODO: Let use know they are being penalized for cooldown
-        reply = handle_commands(msg_packet, shared_data)
-        if reply is None:
-            reply = handle_regexes(msg_packet, shared_data)
-    elif msg_packet.msg_type == 'NUMERIC':
-        if (config['password'] and not config['logged_in'] and
-                msg_packet.numeric == ircp.numerics.RPL_ENDOFMOTD):
-            reply = []  # pylint: disable=redefined-variable-type
-            reply.append(ircp.make_message('identify {} {}'.format(config['bot_nick'],
-                                                                   config['password']),
-                                           'nickserv'))
-            for channel in config['channels'].split(' '):
-                reply.append(ircp.join_chan(channel))
-            shared_data['conf']['logged_in'] = True  # Stop checking for login numerics
-        elif msg_packet.numeric == ircp.numerics.RPL_ENDOFMOTD:
-            reply = (ircp.join_chan(c) for c in shared_data['conf']['channels'].split(' '))
-
-    elif msg_packet.msg_type == 'PING':
-        reply = 'PONG {}'.format(msg_packet.host)
-
-    elif msg_packet.msg_type == 'NICK':
-        print('{} changed nick to {}'.format(msg_packet.sender, msg_packet.nick_to))
-        if msg_packet.sender in shared_data['auth']:
-            shared_data['auth'].remove(msg_packet.sender)
-            shared_data['auth'].add(msg_packet.nick_to)
-            print('moved {} to {} on auth list'.format(msg_packet.sender, msg_packet.nick_to))
-
-    elif msg_packet.msg_type in ('PART', 'QUIT'):
-        if msg_packet.sender in shared_data['auth']:
-            shared_data['auth'].remove(msg_packet.sender)
-            print('removed {} from auth list'.format(msg_packet.sender))
-
-    elif msg_packet.msg_type == 'JOIN':
-        if msg_packet.sender == shared_data['conf']['bot_nick']:
-            shared_data['chan'].add(msg_packet.target)
-            reply = ircp.make_message(shared_data['conf']['intro'], msg_packet.target)
+        if msg_packet.tags and irc_cap.is_history(msg_packet, config):
+            pass  # Don't answer to messages being replayed from history
+        elif offload is not None:
+            offload(msg_packet)
+        else:
+            reply = handle_privmsg(msg_packet, shared_data)
+            if reply is not None:
+                replies.append(reply)
 
-    if isinstance(reply, int):
-        flag = int(reply)
-        reply = [ircp.make_message('kthxbai', c) for c in shared_data['chan']]
-        reply.append(flag)  # Makes sure to close out.
+    command = msg_packet.msg_type
+    if msg_packet.numeric is not None:
+        command = '{:03}'.format(msg_packet.numeric)
+    if command is not None:
+        replies.extend(shared_data['events'].dispatch(command, msg_packet, shared_data))
 
     shared_data['recent_messages'].append(msg_packet)
     shared_data['stats']['num_messages'] += 1
 
-    return reply
+    replies = [quit_reply(reply, shared_data) if isinstance(reply, int) else reply
+               for reply in replies]
+    if not replies:
+        return None
+    elif len(replies) == 1:
+        return replies[0]
+    return replies
+
+
+def load_upgrade_sessions() -> dict:
+    ''' Get the sessions handed to us by the process we replaced (if any),
+    as a dictionary of network name to session.
+    '''
+    state = os.environ.pop(UPGRADE_ENV, None)
+    if not state:
+        return dict()
+    return dict((session['network'], session) for session in json.loads(state))
+
+
+def run_clients(clients) -> bool:
+    ''' Run several clients on one event loop until they all disconnect
+
+    Returns whether or not a restart was requested.
+    '''
+    async def run_all():  # pylint: disable=missing-docstring
+        return await asyncio.gather(*(client.run_forever() for client in clients),
+                                    return_exceptions=True)
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run_all())
+    finally:
+        loop.close()
+
+    for result in results:
+        if isinstance(result, Exception):
+            LOG.error('Connection failed: %s', result)
+    return any(result is True for result in results)
 
 
 def main():
     ''' Start up the client and whatnot.
     This is what is run when executing the bot.
     '''
-    # Setup logging
-    logging.basicConfig(filename='probot.log', level=logging.DEBUG)
-
     # Load configuration file
-    logging.info('Loading configuration (main)')
     config = load_json('config.json')
 
-    server = config['address']
-    port = int(config['port'])
-    bot_nick = config['nick']
-    logging.info('Loaded config (main)')
+    # Setup logging
+    listener = setup_logging(config.get('log_file', 'probot.log'),
+                             config.get('log_level', 'INFO'),
+                             config.get('log_levels', ''))
+    LOG.info('Loaded config (main)')
 
     shared = setup(config)
+    sessions = load_upgrade_sessions()
+
+    for name, network in shared['networks'].items():
+        client = IRCClient(network['conf']['bot_nick'], network)
+        client.resume = sessions.get(name)
+        shared['clients'][name] = client
+    restart = run_clients(shared['clients'].values())
+
+    handoff = [c.handoff for c in shared['clients'].values() if c.handoff is not None]
+    if handoff:
+        os.environ[UPGRADE_ENV] = json.dumps(handoff)
 
-    # Create second thread
-    client = IRCClient(bot_nick, shared)
-    restart = client.run(server, port)
+    if shared['pool'] is not None:
+        shared['pool'].shutdown(wait=False)
 
     if restart > 0:
-        print('restarting')
+        LOG.info('restarting')
+        listener.stop()
         stdout.flush()
-        execl('./probot.py', '')
+        execl('./probot.py', './probot.py')
 
     # Do any needed tying of loose ends
-    # Wait for other thread to stop then close pipe
-    logging.info('Shutting down m8')
+    LOG.info('Shutting down m8')
+    listener.stop()
 
     # Shutdown socket gracefully
     print('Socket closed; bye!')
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Tests for irc_events.EventBus
+
+usage: python3 -m unittest discover tests
+'''
+
+import sys
+import unittest
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from irc_events import CORE, EventBus  # NOQA pylint: disable=wrong-import-position
+
+
+def pong(packet, shared):
+    return 'PONG :' + packet
+
+
+def broken(packet, shared):
+    raise RuntimeError('plugin bug')
+
+
+def echo(packet, shared):
+    return 'echo ' + packet
+
+
+class DispatchTest(unittest.TestCase):
+    def test_raising_subscriber_is_skipped(self):
+        bus = EventBus()
+        bus.subscribe('PING', pong, owner=CORE)
+        bus.subscribe('PING', broken, owner='plugin')
+        bus.subscribe('PING', echo, owner='other')
+
+        with self.assertLogs('probot.dispatch', level='ERROR') as logs:
+            replies = bus.dispatch('PING', 'irc.example.net', {})
+
+        self.assertEqual(replies, ['PONG :irc.example.net', 'echo irc.example.net'])
+        self.assertIn('plugin.broken', logs.output[0])
+        for name in ('core.pong', 'plugin.broken', 'other.echo'):
+            self.assertEqual(bus.stats[name][0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
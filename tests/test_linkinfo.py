@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# probot - An asynchronous IRC bot written in Python 3
+# Copyright (c) 2016 Cameron Conn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Tests for plugins/linkinfo.py
+
+usage: python3 -m unittest discover tests
+'''
+
+import sys
+import unittest
+from os.path import abspath, dirname
+from time import monotonic
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+try:
+    from plugins import linkinfo  # NOQA pylint: disable=wrong-import-position
+except ImportError:  # requests isn't installed
+    linkinfo = None
+
+
+class FakePage:
+    ''' Just enough of a streamed requests.Response to read a title from.
+    Like requests, iter_content(None) hands over the whole body at once,
+    because the server sent a Content-Length.
+    '''
+    def __init__(self, body: bytes):
+        self.body = body
+        self.headers = {'content-type': 'text/html; charset=utf-8',
+                        'content-length': str(len(body))}
+        self.sent = 0
+
+    def iter_content(self, chunk_size=1):
+        size = chunk_size or len(self.body)
+        for start in range(0, len(self.body), size):
+            chunk = self.body[start:start + size]
+            self.sent += len(chunk)
+            yield chunk
+
+
+@unittest.skipIf(linkinfo is None, 'linkinfo needs requests')
+class PageTitleTest(unittest.TestCase):
+    def test_big_page_is_not_read_whole(self):
+        body = b'<html><head><title>Big page</title></head><body>'
+        body += b'x' * (20 * 1024 * 1024) + b'</body></html>'
+        page = FakePage(body)
+
+        title = linkinfo._page_title(page, monotonic() + 10)
+
+        self.assertEqual(title, 'Big page')
+        self.assertLessEqual(page.sent, linkinfo.TITLE_BYTES)
+
+    def test_no_title_stops_at_title_bytes(self):
+        page = FakePage(b'<html><body>' + b'x' * (20 * 1024 * 1024))
+
+        self.assertIsNone(linkinfo._page_title(page, monotonic() + 10))
+        self.assertLessEqual(page.sent, linkinfo.TITLE_BYTES + linkinfo.CHUNK_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()